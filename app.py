@@ -1,33 +1,39 @@
 import gradio as gr
 import os
-import torch
-import time
+import queue
 from engine import VideoGenEngine
+from worker import GenerationWorker
 
 # --- Setup ---
 OUTPUT_DIR = "generated_videos"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Initialize Engine (Lazy loading in generate function for HF Spaces)
-engine = None
+# One engine and one worker thread for the whole app. Models load lazily on the
+# first request and stay in the engine's LRU cache across model switches.
+MAX_QUEUE = int(os.getenv("TRENDEY_APP_MAX_QUEUE") or 16)
+worker = GenerationWorker(VideoGenEngine(), output_dir=OUTPUT_DIR, max_queue=MAX_QUEUE)
 
-def get_engine(model_key):
-    global engine
-    if engine is None or engine.model_type != model_key:
-        engine = VideoGenEngine(model_type=model_key)
-        # Use 1.3B by default for T4 compatibility
-        engine.load_model(model_key="wan-2.1-1.3b") 
-    return engine
+def _status(event):
+    kind = event["type"]
+    if kind == "queued":
+        return f"⏳ Queued ({event['ahead']} ahead)" if event["ahead"] else "⏳ Starting..."
+    if kind == "loading":
+        return f"📦 Preparing {event['model']}..."
+    if kind == "progress":
+        return f"🎞️ Denoising step {event['step']}/{event['total']}"
+    if kind == "music":
+        return "🎵 Generating background music..."
+    if kind == "saving":
+        return "💾 Encoding video..."
+    return None
 
 def generate_video(prompt, neg_prompt, model_choice, resolution, frames, steps, guidance, seed, add_audio):
     try:
-        current_engine = get_engine(model_choice)
-        
-        # Parse resolution
-        w, h = map(int, resolution.split("x"))
-        
-        # generation
-        video_frames, used_seed, latency = current_engine.generate(
+        # Parse resolution ("480x832 (Portrait)" -> 480, 832)
+        w, h = map(int, resolution.split(" ")[0].split("x"))
+
+        job = worker.submit(
+            model=model_choice,
             prompt=prompt,
             negative_prompt=neg_prompt,
             width=w,
@@ -35,24 +41,21 @@ def generate_video(prompt, neg_prompt, model_choice, resolution, frames, steps,
             num_frames=int(frames),
             steps=int(steps),
             guidance=float(guidance),
-            seed=int(seed)
+            seed=int(seed),
+            add_audio=add_audio,
         )
-        
-        # Audio generation if requested
-        audio_path = None
-        if add_audio:
-            audio_path = current_engine.generate_audio_bg(prompt)
-            
-        # Save
-        filename = f"vid_{int(time.time())}.mp4"
-        output_path = os.path.join(OUTPUT_DIR, filename)
-        final_video_path = current_engine.save_result(video_frames, output_path, audio_path=audio_path)
-        
-        status = f"✅ Generated in {latency:.1f}s | Seed: {used_seed}"
-        return final_video_path, status
-        
+        for event in job.stream(ahead=worker.ahead):
+            if event["type"] == "done":
+                yield event["path"], f"✅ Generated in {event['latency']:.1f}s | Seed: {event['seed']}"
+            elif event["type"] == "error":
+                yield None, f"❌ Error: {event['error']}"
+            else:
+                yield gr.update(), _status(event)
+
+    except queue.Full:
+        yield None, "❌ Too many requests queued, please try again shortly."
     except Exception as e:
-        return None, f"❌ Error: {str(e)}"
+        yield None, f"❌ Error: {str(e)}"
 
 # --- Custom CSS for Premium Look ---
 css = """
@@ -77,7 +80,7 @@ footer {visibility: hidden}
 
 # --- Gradio UI ---
 with gr.Blocks(theme=gr.themes.Soft(), css=css) as demo:
-    with gr.Div(elem_id="title-container"):
+    with gr.Column(elem_id="title-container"):
         gr.Markdown("# 🎬 Trendey Pro")
         gr.Markdown("### Next-Gen High Resolution AI Video for Content Creators")
 
@@ -135,7 +138,9 @@ with gr.Blocks(theme=gr.themes.Soft(), css=css) as demo:
     generate_btn.click(
         fn=generate_video,
         inputs=[prompt, neg_prompt, model_choice, resolution, frames, steps, guidance, seed, add_audio],
-        outputs=[video_output, status_box]
+        outputs=[video_output, status_box],
+        # Requests wait in the worker's queue, where they see their position
+        concurrency_limit=MAX_QUEUE,
     )
 
     gr.Examples(
@@ -1,40 +1,336 @@
-from moviepy.editor import VideoFileClip, AudioFileClip, CompositeVideoClip, clips_array
 import os
+import math
+import subprocess
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+from tracing import span, file_size
+from timeline import compile_timeline
+from media import probe_info, get_profile
+
+# MoviePy is imported from its submodules inside the MoviePy path only:
+# moviepy.editor drags in every effect and preview plugin, and the ffmpeg
+# path doesn't need it at all.
+
+def _paste(canvas, frame, box, buffers=None):
+    """Draws `frame` into `box` = (x, y, w, h) on the canvas, resizing if needed.
+
+    `buffers` maps (w, h) to preallocated resize targets reused across frames.
+    """
+    x, y, w, h = box
+    if frame.shape[0] != h or frame.shape[1] != w:
+        if buffers is None:
+            frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+        else:
+            buf = buffers.get((w, h))
+            if buf is None or buf.shape[2] != frame.shape[2]:
+                buf = buffers[(w, h)] = np.empty((h, w, frame.shape[2]), dtype=np.uint8)
+            frame = cv2.resize(frame, (w, h), dst=buf, interpolation=cv2.INTER_AREA)
+    # Clip to the canvas so oversized boxes can't raise
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, canvas.shape[1]), min(y + h, canvas.shape[0])
+    if x1 > x0 and y1 > y0:
+        canvas[y0:y1, x0:x1] = frame[y0 - y:y1 - y, x0 - x:x1 - x, :3]
+
+class ClipWindow:
+    """Opens VideoFileClips only when the render reaches them, keeping at most `size` readers alive.
+
+    Each clip holds an ffmpeg reader subprocess and its frame buffer, so the
+    least recently used one is closed as soon as another is needed.
+    """
+
+    def __init__(self, paths, size=1):
+        self.paths = paths
+        self.size = size
+        self._open = OrderedDict()
+
+    def get(self, index):
+        clip = self._open.get(index)
+        if clip is not None:
+            self._open.move_to_end(index)
+            return clip
+        while len(self._open) >= self.size:
+            _, old = self._open.popitem(last=False)
+            old.close()
+        from moviepy.video.io.VideoFileClip import VideoFileClip
+        clip = self._open[index] = VideoFileClip(self.paths[index], audio=False)
+        return clip
+
+    def close(self):
+        while self._open:
+            _, clip = self._open.popitem()
+            clip.close()
+
+def _audio_rate(path):
+    """Sample rate of a file's audio stream, or None if ffmpeg doesn't report one."""
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+    rate = ffmpeg_parse_infos(path).get("audio_fps")
+    return rate if isinstance(rate, int) and rate > 0 else None
+
+def _clip_info(path):
+    """(width, height, fps, duration) parsed from ffmpeg's header dump, without starting a reader."""
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+    info = ffmpeg_parse_infos(path)
+    w, h = info["video_size"]
+    return w, h, info.get("video_fps") or 24, info.get("video_duration") or info["duration"]
 
 class VideoAssembler:
     """Stitches B-Roll and Talking Avatar into a final YouTube video."""
     
-    def __init__(self, output_dir="exports"):
+    def __init__(self, output_dir="exports", profile=None):
         self.output_dir = output_dir
+        # Encode profile name (see media.PROFILES) or an already resolved profile dict
+        self.profile = profile if isinstance(profile, dict) else get_profile(profile)
         os.makedirs(output_dir, exist_ok=True)
 
+    @staticmethod
+    def avatar_segments(avatar):
+        """Normalizes the avatar input: one video path, or rendered segments with `path` and `start`."""
+        if isinstance(avatar, str):
+            return [{"path": avatar, "start": 0.0}]
+        return [seg for seg in avatar if seg.get("path")]
+
     def assemble(self, b_roll_paths, avatar_video_path, audio_path, script_data, final_name="final_video.mp4"):
+        with span("assemble", backend="moviepy", clips=len(b_roll_paths)) as s:
+            output_path = self._assemble(b_roll_paths, avatar_video_path, audio_path, script_data, final_name)
+            s["bytes"] = file_size(output_path)
+        return output_path
+
+    def _assemble(self, b_roll_paths, avatar_video_path, audio_path, script_data, final_name):
         print("🧵 Stitching multi-layer video...")
         
+        from moviepy.audio.io.AudioFileClip import AudioFileClip
+        from moviepy.video.VideoClip import VideoClip
+        
         # 1. Load Audio
-        audio = AudioFileClip(audio_path)
+        # Decode at the voiceover's own rate; AudioFileClip otherwise resamples to 44.1 kHz
+        audio = AudioFileClip(audio_path, fps=_audio_rate(audio_path) or 44100)
         
-        # 2. Sequence B-Roll
-        clips = []
-        for path in b_roll_paths:
-            clips.append(VideoFileClip(path).without_audio())
+        # 2. Read b-roll and avatar headers; clips are opened later, one at a time per layer
+        sources = [_clip_info(path) for path in b_roll_paths]
+        segments = self.avatar_segments(avatar_video_path)
+        avatars = [_clip_info(segment["path"]) for segment in segments]
         
-        # concatenate b-roll to match audio duration
-        background = clips[0] # Simplification: use first for now, or concat
-        # background = concatenate_videoclips(clips).resize(height=1080)
-        background = background.set_duration(audio.duration)
+        # 3. Compile b-roll cuts and avatar_schedule into a static edit decision list
+        profile = self.profile
+        timeline = compile_timeline(
+            [(w, h, d) for w, h, _, d in sources],
+            [{"start": seg["start"], "width": w, "height": h, "duration": d}
+             for seg, (w, h, _, d) in zip(segments, avatars)],
+            (script_data or {}).get("avatar_schedule"),
+            audio.duration,
+            # Native rate: the fastest source, so neither b-roll nor the avatar is decimated
+            fps=profile["fps"] or max(fps for _, _, fps, _ in sources + avatars),
+            size=profile["size"],
+            fit=profile["fit"]
+        )
         
-        # 3. Process Avatar (Overlay)
-        avatar = VideoFileClip(avatar_video_path).resize(height=300) # Small corner size
+        # 4. Render in one pass: each frame looks up its cuts and composites into one
+        # preallocated canvas. Cuts are visited in time order, so one open reader per
+        # layer suffices and memory stays flat however many clips there are.
+        canvas = np.zeros((timeline.height, timeline.width, 3), dtype=np.uint8)
+        buffers = {}
+        b_roll = ClipWindow(b_roll_paths)
+        avatar = ClipWindow([segment["path"] for segment in segments])
         
-        # 4. Composite Layering
-        # Position: Bottom Right (with margin)
-        avatar_overlay = avatar.set_position(("right", "bottom")).margin(right=50, bottom=50, opacity=0)
+        def local_time(info, cut, t):
+            return min(cut.offset + t - cut.start, max(info[3] - 1.0 / timeline.fps, 0))
         
-        final = CompositeVideoClip([background, avatar_overlay])
+        def covers(box):
+            return box[0] <= 0 and box[1] <= 0 and box[0] + box[2] >= timeline.width and box[1] + box[3] >= timeline.height
+        
+        def make_frame(t):
+            bg, av = timeline.at(t)
+            if not bg or not covers(bg.box):
+                canvas.fill(0)
+            if bg:
+                frame = b_roll.get(bg.source).get_frame(local_time(sources[bg.source], bg, t))
+                _paste(canvas, frame, bg.box, buffers)
+            if av:
+                frame = avatar.get(av.source).get_frame(local_time(avatars[av.source], av, t))
+                _paste(canvas, frame, av.box, buffers)
+            return canvas
+        
+        final = VideoClip(make_frame, duration=audio.duration)
         final = final.set_audio(audio)
         
         output_path = os.path.join(self.output_dir, final_name)
-        final.write_videofile(output_path, codec="libx264", audio_codec="aac", fps=24)
+        try:
+            final.write_videofile(
+                output_path, codec="libx264", audio_codec="aac", fps=timeline.fps,
+                preset=profile["preset"], threads=profile["threads"], audio_bitrate=profile["audio_bitrate"],
+                audio_fps=audio.fps,
+                ffmpeg_params=["-crf", str(profile["crf"]), "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+                               *_rate_control(profile)]
+            )
+        finally:
+            # Release every reader subprocess now rather than whenever the clips are collected
+            b_roll.close()
+            avatar.close()
+            final.close()
+            audio.close()
         
         return output_path
+
+def _rate_control(profile):
+    """x264 VBV flags capping a CRF encode at the profile's maxrate."""
+    if not profile.get("maxrate"):
+        return []
+    rate = profile["maxrate"]
+    unit = rate[-1] if rate[-1].isalpha() else ""
+    return ["-maxrate", rate, "-bufsize", f"{float(rate.rstrip('kKmM')) * 2:g}{unit}"]
+
+
+class FFmpegAssembler(VideoAssembler):
+    """Same timeline as VideoAssembler, rendered by a single ffmpeg filtergraph.
+
+    Frames never pass through Python: ffmpeg decodes, scales, overlays and
+    encodes in one streaming process.
+    """
+
+    def __init__(self, output_dir="exports", profile=None, preset=None, crf=None, threads=None, fps=None,
+                 ffmpeg="ffmpeg", ffprobe="ffprobe"):
+        if not isinstance(profile, dict):
+            profile = get_profile(profile, preset=preset, crf=crf, threads=threads, fps=fps)
+        super().__init__(output_dir, profile)
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+
+    @staticmethod
+    def _place(src_w, src_h, box, width, height):
+        """Filters that bring a source to its box on the canvas; empty when it already fits."""
+        x, y, w, h = box
+        chain = []
+        if (w, h) != (src_w, src_h):
+            chain.append(f"scale={w}:{h}")
+        if (w, h) != (width, height):
+            if w <= width and h <= height:
+                chain.append(f"pad={width}:{height}:{x}:{y}")
+            else:
+                chain.append(f"crop={width}:{height}:{-x}:{-y}")
+        return chain
+
+    def build_command(self, b_roll_paths, avatar_video_path, audio_path, output_path, script_data=None):
+        """Builds the ffmpeg argv for one assembly job from the compiled timeline."""
+        profile = self.profile
+        audio = probe_info(audio_path, self.ffprobe)
+        audio_duration = audio["duration"]
+        sources = [probe_info(p, self.ffprobe) for p in b_roll_paths]
+        segments = self.avatar_segments(avatar_video_path)
+        avatars = [probe_info(seg["path"], self.ffprobe) for seg in segments]
+        # Native rate: the fastest source, so neither b-roll nor the avatar is decimated
+        fps = profile["fps"] or max(src["fps"] or 24 for src in sources + avatars)
+        timeline = compile_timeline(
+            [(src["width"], src["height"], src["duration"]) for src in sources],
+            [{"start": seg["start"], "width": av["width"], "height": av["height"], "duration": av["duration"]}
+             for seg, av in zip(segments, avatars)],
+            (script_data or {}).get("avatar_schedule"),
+            audio_duration,
+            fps=fps,
+            size=profile["size"],
+            fit=profile["fit"]
+        )
+
+        # Repeat the b-roll sequence until it covers the voiceover, like the timeline's looping cuts
+        sequence_duration = sum(src["duration"] for src in sources)
+        repeats = max(1, math.ceil(audio_duration / sequence_duration))
+        paths = list(b_roll_paths) * repeats
+        width, height = timeline.width, timeline.height
+
+        cmd = [self.ffmpeg, "-y", "-v", "error"]
+        for path in paths:
+            cmd += ["-i", path]
+        for segment in segments:
+            cmd += ["-i", segment["path"]]
+        audio_idx = len(paths) + len(segments)
+        cmd += ["-i", audio_path]
+
+        # Only scale, pad/crop or resample b-roll that doesn't already match the output
+        filters = []
+        for i in range(len(paths)):
+            src = sources[i % len(sources)]
+            box = timeline.boxes[i % len(sources)]
+            chain = self._place(src["width"], src["height"], box, width, height)
+            if not src["fps"] or abs(src["fps"] - fps) > 0.01:
+                chain.append(f"fps={fps}")
+            filters.append(f"[{i}:v]" + ",".join(chain + ["setsar=1"]) + f"[b{i}]")
+        inputs = "".join(f"[b{i}]" for i in range(len(paths)))
+        filters.append(f"{inputs}concat=n={len(paths)}:v=1:a=0,trim=duration={audio_duration:.3f},setpts=PTS-STARTPTS[bg]")
+
+        # Every avatar cut is trimmed from its segment, scaled to its layout box,
+        # shifted to its start time and overlaid; a segment used by several cuts is split.
+        # overlay samples it at the background's frame rate, so it is never resampled itself.
+        cuts_by_source = {}
+        for cut in timeline.avatar:
+            cuts_by_source.setdefault(cut.source, []).append(cut)
+        last = "bg"
+        n = 0
+        for source, cuts in cuts_by_source.items():
+            idx = len(paths) + source
+            labels = [f"s{source}_{j}" for j in range(len(cuts))]
+            if len(cuts) > 1:
+                filters.append(f"[{idx}:v]split={len(cuts)}" + "".join(f"[{l}]" for l in labels))
+            else:
+                labels = [f"{idx}:v"]
+            for label, cut in zip(labels, cuts):
+                x, y, w, h = cut.box
+                scale = "" if (w, h) == (avatars[source]["width"], avatars[source]["height"]) else f",scale={w}:{h}"
+                # Video that ends before its cut (e.g. a segment whose audio outlasts
+                # the frames) holds its last frame like the MoviePy path: clone-pad
+                # before trimming, since trim ends the stream at the source's EOF
+                end = cut.offset + cut.end - cut.start
+                filters.append(
+                    f"[{label}]tpad=stop_mode=clone:stop_duration={end:.3f},"
+                    f"trim=start={cut.offset:.3f}:end={end:.3f},"
+                    f"setpts=PTS-STARTPTS+{cut.start:.3f}/TB{scale}[c{n}]"
+                )
+                filters.append(f"[{last}][c{n}]overlay=x={x}:y={y}:eof_action=pass[ov{n}]")
+                last = f"ov{n}"
+                n += 1
+        filters.append(f"[{last}]format=yuv420p[out]")
+
+        # An AAC voiceover is muxed as is; anything else is encoded at its own sample rate
+        if audio.get("audio_codec") == "aac":
+            audio_args = ["-c:a", "copy"]
+        else:
+            audio_args = ["-c:a", "aac", "-b:a", profile["audio_bitrate"]]
+
+        cmd += [
+            "-filter_complex", ";".join(filters),
+            "-map", "[out]", "-map", f"{audio_idx}:a",
+            "-c:v", "libx264", "-preset", profile["preset"], "-crf", str(profile["crf"]),
+            *_rate_control(profile), "-threads", str(profile["threads"]), "-r", f"{fps:g}",
+            *audio_args, "-t", f"{audio_duration:.3f}", "-movflags", "+faststart",
+            output_path,
+        ]
+        return cmd
+
+    def assemble(self, b_roll_paths, avatar_video_path, audio_path, script_data, final_name="final_video.mp4"):
+        with span("assemble", backend="ffmpeg", clips=len(b_roll_paths)) as s:
+            output_path = self._assemble(b_roll_paths, avatar_video_path, audio_path, script_data, final_name)
+            s["bytes"] = file_size(output_path)
+        return output_path
+
+    def _assemble(self, b_roll_paths, avatar_video_path, audio_path, script_data, final_name):
+        print("🧵 Stitching multi-layer video (ffmpeg)...")
+        output_path = os.path.join(self.output_dir, final_name)
+        cmd = self.build_command(b_roll_paths, avatar_video_path, audio_path, output_path, script_data)
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg assembly failed: {result.stderr.strip()[-500:]}")
+        return output_path
+
+    @classmethod
+    def from_env(cls, output_dir="exports"):
+        """Reads TRENDEY_PROFILE, with TRENDEY_FFMPEG_PRESET / _CRF / _THREADS overriding it when set."""
+        crf = (os.getenv("TRENDEY_FFMPEG_CRF") or "").strip()
+        threads = (os.getenv("TRENDEY_FFMPEG_THREADS") or "").strip()
+        return cls(
+            output_dir,
+            preset=(os.getenv("TRENDEY_FFMPEG_PRESET") or "").strip() or None,
+            crf=int(crf) if crf else None,
+            threads=int(threads) if threads else None,
+            ffmpeg=(os.getenv("FFMPEG_BINARY") or "").strip() or "ffmpeg",
+            ffprobe=(os.getenv("FFPROBE_BINARY") or "").strip() or "ffprobe",
+        )
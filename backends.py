@@ -0,0 +1,190 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from tracing import propagate
+
+class Cancelled(Exception):
+    """Raised inside an attempt whose hedged twin already won."""
+
+def await_future(future, cancel, on_cancel=None, poll=0.5):
+    """Waits for a Future, giving up (and cancelling it) once `cancel` is set."""
+    while not future.done():
+        wait([future], timeout=poll)
+        if cancel.is_set() and not future.done():
+            future.cancel()
+            if on_cancel:
+                try:
+                    on_cancel()
+                except Exception:
+                    pass
+            raise Cancelled()
+    return future.result()
+
+class Backend:
+    """Health and load statistics for one Space."""
+
+    def __init__(self, space):
+        self.space = space
+        self.inflight = 0
+        self.queue_depth = 0
+        # Abandoned jobs (hedge losers, timeouts) still running remotely
+        self.orphaned = 0
+        self.latency = None
+        self.success_rate = 1.0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.down_until
+
+    def score(self, default_latency):
+        """Expected completion time; lower is better."""
+        latency = self.latency or default_latency
+        return latency * (1 + self.inflight + self.queue_depth + self.orphaned) / max(self.success_rate, 0.05)
+
+class BackendPool:
+    """Routes jobs for one role (video, avatar) across several Spaces.
+
+    Each job goes to the healthy backend with the lowest expected completion
+    time. If it runs past the hedge delay a duplicate is started on the next
+    best backend and whichever finishes first wins; the loser is cancelled.
+    Failures fail over to the remaining backends, and repeated failures take
+    a backend out of rotation for `cooldown` seconds.
+    """
+
+    def __init__(self, role, spaces, default_latency=300.0, hedge_after=None, hedge_factor=1.5,
+                 failure_threshold=2, cooldown=300.0, alpha=0.3):
+        if isinstance(spaces, str):
+            spaces = [s.strip() for s in spaces.split(",") if s.strip()]
+        if not spaces:
+            raise ValueError(f"No backends configured for {role}")
+        self.role = role
+        self.backends = [Backend(space) for space in spaces]
+        self.default_latency = default_latency
+        self.hedge_after = hedge_after
+        self.hedge_factor = hedge_factor
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    @property
+    def spaces(self):
+        return [b.space for b in self.backends]
+
+    def choose(self, exclude=()):
+        with self._lock:
+            candidates = [b for b in self.backends if b.space not in exclude]
+            # If everything is cooling down, a degraded backend beats none at all
+            healthy = [b for b in candidates if b.healthy] or candidates
+            if not healthy:
+                return None
+            return min(healthy, key=lambda b: b.score(self.default_latency))
+
+    def record(self, backend, ok, latency=None):
+        with self._lock:
+            backend.success_rate = (1 - self.alpha) * backend.success_rate + self.alpha * (1.0 if ok else 0.0)
+            if ok:
+                backend.consecutive_failures = 0
+                if latency is not None:
+                    backend.latency = latency if backend.latency is None else \
+                        (1 - self.alpha) * backend.latency + self.alpha * latency
+            else:
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.failure_threshold:
+                    backend.down_until = time.monotonic() + self.cooldown
+                    print(f"   🚫 {self.role} backend {backend.space} marked down for {self.cooldown:.0f}s")
+
+    def orphaned(self, backend, delta):
+        """Counts a job abandoned on `backend` (+1) or finally finished there (-1)."""
+        with self._lock:
+            backend.orphaned += delta
+
+    def hedge_delay(self, backend):
+        """Seconds to wait on `backend` before hedging, or None if hedging is off."""
+        if self.hedge_after == 0 or len(self.backends) < 2:
+            return None
+        if self.hedge_after is not None:
+            return self.hedge_after
+        return (backend.latency or self.default_latency) * self.hedge_factor
+
+    def _attempt(self, backend, fn, cancel):
+        with self._lock:
+            backend.inflight += 1
+        t0 = time.monotonic()
+        try:
+            result = fn(backend, cancel)
+        except Cancelled:
+            raise
+        except Exception:
+            self.record(backend, False)
+            raise
+        else:
+            self.record(backend, True, time.monotonic() - t0)
+            return result
+        finally:
+            with self._lock:
+                backend.inflight -= 1
+
+    def run(self, fn, label):
+        """Runs `fn(backend, cancel_event)` with routing, hedging and failover."""
+        tried = set()
+        attempts = {}
+        executor = ThreadPoolExecutor(max_workers=len(self.backends), thread_name_prefix=f"{self.role}-attempt")
+
+        def launch():
+            backend = self.choose(exclude=tried)
+            if backend is None:
+                return None
+            tried.add(backend.space)
+            cancel = threading.Event()
+            attempts[executor.submit(propagate(self._attempt), backend, fn, cancel)] = (backend, cancel, time.monotonic())
+            print(f"   🧭 {label}: routed to {backend.space}")
+            return backend
+
+        hedged = False
+        last_error = None
+        try:
+            launch()
+            while attempts:
+                timeout = None
+                if not hedged and len(attempts) == 1 and len(tried) < len(self.backends):
+                    backend, _, started = next(iter(attempts.values()))
+                    delay = self.hedge_delay(backend)
+                    if delay is not None:
+                        timeout = max(0.0, started + delay - time.monotonic())
+
+                done, _ = wait(attempts, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    print(f"   🪁 {label}: {backend.space} is slow, hedging")
+                    launch()
+                    continue
+
+                for future in done:
+                    backend, _, _ = attempts.pop(future)
+                    try:
+                        result = future.result()
+                    except Cancelled:
+                        continue
+                    except Exception as e:
+                        last_error = e
+                        print(f"   ⚠️ {label}: {backend.space} failed ({e})")
+                        if not attempts and not launch():
+                            raise
+                        continue
+
+                    for _, (other, cancel, _) in attempts.items():
+                        print(f"   ✂️ {label}: cancelling slower attempt on {other.space}")
+                        cancel.set()
+                    return result
+            raise last_error or RuntimeError(f"{label}: no {self.role} backend available")
+        finally:
+            executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            return {b.space: {"latency": b.latency, "success_rate": b.success_rate, "inflight": b.inflight,
+                              "queue_depth": b.queue_depth, "orphaned": b.orphaned, "healthy": b.healthy} for b in self.backends}
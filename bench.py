@@ -0,0 +1,326 @@
+"""Offline benchmark for the Trendey pipeline.
+
+Replaces the LLM, TTS and HF Spaces with local stand-ins that serve canned
+clips after a configurable latency, then drives TrendeyOrchestrator.run and
+VideoAssembler.assemble end to end. Results (per-stage wall time, CPU time
+and peak RSS) are written as JSON so CI can track regressions without a GPU
+or network. The startup benchmark times cold starts of the CLI in fresh
+interpreters.
+
+    python bench.py --latency 2 --assembler ffmpeg --out bench.json
+    python bench.py --only startup
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from engine import ScriptEngine, RemoteAssetEngine, AudioEngine
+from tracing import tracer
+from delivery import TelegramDelivery
+
+FFMPEG = (os.getenv("FFMPEG_BINARY") or "").strip() or "ffmpeg"
+FFPROBE = (os.getenv("FFPROBE_BINARY") or "").strip() or "ffprobe"
+# Modules whose import dominates startup; the startup benchmark reports which got loaded
+HEAVY_MODULES = ("moviepy", "gradio_client", "huggingface_hub", "edge_tts", "requests", "cv2", "numpy")
+
+def make_fixtures(root, duration=10.0, clip_duration=4.0):
+    """Renders canned b-roll, avatar and voiceover files with ffmpeg's test sources."""
+    os.makedirs(root, exist_ok=True)
+    fixtures = {
+        "broll": (os.path.join(root, "broll.mp4"), ["-f", "lavfi", "-i", f"testsrc2=s=1280x720:r=16:d={clip_duration}"]),
+        "avatar": (os.path.join(root, "avatar.mp4"), ["-f", "lavfi", "-i", f"testsrc=s=512x512:r=25:d={duration}"]),
+        "audio": (os.path.join(root, "voiceover.mp3"), ["-f", "lavfi", "-i", f"sine=frequency=440:d={duration}"]),
+    }
+    for path, args in fixtures.values():
+        if not os.path.exists(path):
+            subprocess.run([FFMPEG, "-y", "-v", "error", *args, path], check=True)
+    return {name: path for name, (path, _) in fixtures.items()}
+
+def _copy_to_temp(src):
+    """Mimics gradio_client handing back a fresh temp file per result."""
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(src)[1])
+    os.close(fd)
+    shutil.copyfile(src, path)
+    return path
+
+class FakeLLM:
+    """Stands in for InferenceClient.chat_completion."""
+    def __init__(self, latency, prompts=3):
+        self.latency = latency
+        self.prompts = prompts
+
+    def chat_completion(self, messages, max_tokens=None):
+        time.sleep(self.latency)
+        script = {
+            "title": "Benchmark Video",
+            "voiceover_text": "This is a benchmark. " * 20,
+            "b_roll_prompts": [f"benchmark shot {i + 1}" for i in range(self.prompts)],
+            "avatar_schedule": [
+                {"time": 0, "position": "center", "action": "intro"},
+                {"time": 3, "position": "corner", "action": "talk"},
+            ],
+        }
+        message = SimpleNamespace(content=json.dumps(script))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+class FakeAudioEngine(AudioEngine):
+    """Edge-TTS stand-in: waits, then writes the canned voiceover."""
+    def __init__(self, canned, latency, cache=None):
+        super().__init__(cache=cache)
+        self.canned = canned
+        self.latency = latency
+
+    async def _gen(self, text, path):
+        await asyncio.sleep(self.latency)
+        shutil.copyfile(self.canned, path)
+
+class FakeJob:
+    """Minimal gradio_client Job: done after `latency` seconds."""
+    def __init__(self, result_fn, latency):
+        self.result_fn = result_fn
+        self.latency = latency
+        self.started = time.monotonic()
+
+    def done(self):
+        return time.monotonic() - self.started >= self.latency
+
+    def status(self):
+        return SimpleNamespace(eta=self.latency, progress_data=None)
+
+    def result(self):
+        return self.result_fn()
+
+    def cancel(self):
+        return True
+
+class FakeSpaceClient:
+    """Emulates the Wan /t2v_generation_async + /status_refresh flow and LivePortrait."""
+    def __init__(self, space, token=None, clips=None, latency=0.0):
+        self.space = space
+        self.clips = clips
+        self.latency = latency
+        self.started = None
+        self.calls = 0
+
+    def predict(self, *args, api_name=None, fn_index=None):
+        self.calls += 1
+        if api_name == "/t2v_generation_async":
+            self.started = time.monotonic()
+            return (None, self.latency)
+        if api_name == "/status_refresh":
+            elapsed = time.monotonic() - self.started
+            if elapsed >= self.latency:
+                return ({"video": _copy_to_temp(self.clips["broll"])}, None, None, 100)
+            return (None, None, None, int(100 * elapsed / max(self.latency, 1e-6)))
+        raise ValueError(f"Unknown endpoint {api_name}")
+
+    def submit(self, *args, api_name=None, fn_index=None):
+        if api_name == "/t2v_generation_async":
+            # The trigger returns at once; the render is then polled via /status_refresh
+            return FakeJob(lambda: self.predict(*args, api_name=api_name), 0.0)
+        self.calls += 1
+        return FakeJob(lambda: _copy_to_temp(self.clips["avatar"]), self.latency)
+
+class FakeTelegram:
+    """Local Bot API stand-in: drains uploads, rejects ones over `max_bytes`, can fail the first calls."""
+    def __init__(self, max_bytes=50 * 1024 * 1024, fail_first=0):
+        self.max_bytes = max_bytes
+        self.fail_first = fail_first
+        self.calls = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                remaining = length
+                while remaining > 0:
+                    remaining -= len(self.rfile.read(min(remaining, 1 << 16)))
+                method = self.path.rsplit("/", 1)[-1]
+                fake.calls.append({"method": method, "bytes": length})
+                if len(fake.calls) <= fake.fail_first:
+                    status, body = 502, {"ok": False, "description": "Bad Gateway"}
+                elif length > fake.max_bytes:
+                    status, body = 413, {"ok": False, "description": "Request Entity Too Large"}
+                else:
+                    status, body = 200, {"ok": True, "result": {"message_id": len(fake.calls)}}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def _rss_mb():
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {"self_mb": self_kb / 1024, "children_mb": child_kb / 1024}
+
+def _cpu():
+    t = os.times()
+    return {"user": t.user, "system": t.system, "children": t.children_user + t.children_system}
+
+def _cpu_delta(before, after):
+    return {k: after[k] - before[k] for k in before}
+
+def make_assembler(name, output_dir, profile=None):
+    from assembler import VideoAssembler, FFmpegAssembler
+    if name == "ffmpeg":
+        return FFmpegAssembler(output_dir, profile=profile, ffmpeg=FFMPEG, ffprobe=FFPROBE)
+    return VideoAssembler(output_dir, profile=profile)
+
+def bench_pipeline(fixtures, workdir, args):
+    from orchestrator import TrendeyOrchestrator
+    latency = args.latency
+
+    script_engine = ScriptEngine(api_key="bench")
+    script_engine.client = FakeLLM(latency, prompts=args.prompts)
+    factory = lambda space, token=None: FakeSpaceClient(space, token, clips=fixtures, latency=latency)
+    asset_engine = RemoteAssetEngine("bench/video", "bench/avatar", hf_token="bench",
+                                     max_video_jobs=args.jobs, client_factory=factory)
+    # Poll quickly so tracker overhead doesn't hide orchestration changes
+    asset_engine.tracker.min_interval = min(asset_engine.tracker.min_interval, max(latency / 10, 0.05))
+
+    agent = TrendeyOrchestrator(
+        script_engine=script_engine,
+        asset_engine=asset_engine,
+        audio_engine=FakeAudioEngine(fixtures["audio"], latency),
+        assembler=make_assembler(args.assembler, os.path.join(workdir, "exports"), args.profile),
+    )
+    agent.hf_token = "bench"
+    agent.avatar_ref = os.path.abspath(agent.avatar_ref)
+    telegram = FakeTelegram(fail_first=1)
+    agent.delivery = TelegramDelivery("bench", "bench", api_base=telegram.url, backoff=0.05,
+                                      ffmpeg=FFMPEG, ffprobe=FFPROBE)
+
+    cwd = os.getcwd()
+    mark = tracer.mark()
+    os.chdir(workdir)
+    try:
+        cpu0, t0 = _cpu(), time.perf_counter()
+        agent.run()
+        wall = time.perf_counter() - t0
+        cpu = _cpu_delta(cpu0, _cpu())
+    finally:
+        os.chdir(cwd)
+        telegram.close()
+
+    graph = agent.last_graph
+    return {
+        "wall_s": wall,
+        "cpu_s": cpu,
+        # Stage CPU: cpu_s is the stage's thread; process/children CPU and RSS overlap across concurrent stages
+        "stages": {name: {"wall_s": t["duration"], "cpu_s": t.get("cpu"),
+                          "process_cpu_s": t.get("process_cpu"), "children_cpu_s": t.get("children_cpu"),
+                          "peak_rss_mb": t.get("peak_rss_mb"), "rss_growth_mb": t.get("rss_growth_mb")}
+                   for name, t in graph.timings.items()},
+        "job_latency_s": dict(asset_engine.tracker.latencies),
+        "telegram_calls": telegram.calls,
+        "spans": tracer.summary(since=mark),
+    }
+
+def bench_assembly(fixtures, workdir, args):
+    assembler = make_assembler(args.assembler, os.path.join(workdir, "exports-assembly"), args.profile)
+    b_roll = [fixtures["broll"]] * args.prompts
+    cpu0, t0 = _cpu(), time.perf_counter()
+    assembler.assemble(b_roll, fixtures["avatar"], fixtures["audio"], {}, final_name="bench.mp4")
+    return {"wall_s": time.perf_counter() - t0, "cpu_s": _cpu_delta(cpu0, _cpu())}
+
+# Imports orchestrator (args=None) or runs it as __main__ in a fresh
+# interpreter, then prints which heavy modules got loaded
+_STARTUP_PROBE = """
+import sys, json, runpy
+args, heavy = json.loads(sys.argv[1]), set(json.loads(sys.argv[2]))
+if args is None:
+    import orchestrator
+else:
+    sys.argv = ["orchestrator.py", *args]
+    try:
+        runpy.run_path("orchestrator.py", run_name="__main__")
+    except SystemExit:
+        pass
+print(json.dumps(sorted({name.split(".")[0] for name in sys.modules} & heavy)))
+"""
+
+def bench_startup(repeat=3):
+    """Cold-start cost of the CLI (best of `repeat`): importing it, a run failing validation, a --dry-run."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    cases = {
+        "import": (None, {}),
+        "failed_run": ([], {"HF_TOKEN": ""}),
+        "dry_run": (["--dry-run"], {"HF_TOKEN": "bench"}),
+    }
+    report = {}
+    for name, (cli_args, env) in cases.items():
+        walls = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            out = subprocess.run(
+                [sys.executable, "-c", _STARTUP_PROBE, json.dumps(cli_args), json.dumps(HEAVY_MODULES)],
+                cwd=root, env={**os.environ, **env}, capture_output=True, text=True, check=True
+            ).stdout
+            walls.append(time.perf_counter() - t0)
+        report[name] = {"wall_s": min(walls), "heavy_modules": json.loads(out.strip().splitlines()[-1])}
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Trendey with local stand-ins for remote services.")
+    parser.add_argument("--latency", type=float, default=1.0, help="Injected latency per remote call (s)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Voiceover length of the canned fixtures (s)")
+    parser.add_argument("--prompts", type=int, default=3, help="Number of b-roll prompts")
+    parser.add_argument("--jobs", type=int, default=3, help="b-roll jobs in flight")
+    parser.add_argument("--assembler", choices=["moviepy", "ffmpeg"], default="moviepy")
+    parser.add_argument("--profile", help="Encode profile (see media.PROFILES)")
+    parser.add_argument("--only", choices=["pipeline", "assembly", "startup"], help="Run a single benchmark")
+    parser.add_argument("--out", help="Write JSON results here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="trendey-bench-")
+    os.environ["TRENDEY_CACHE_DIR"] = "off"
+    try:
+        report = {"config": vars(args), "python": sys.version.split()[0]}
+        if args.only in (None, "startup"):
+            report["startup"] = bench_startup()
+        if args.only != "startup":
+            fixtures = make_fixtures(os.path.join(workdir, "fixtures"), duration=args.duration)
+        if args.only in (None, "assembly"):
+            report["assembly"] = bench_assembly(fixtures, workdir, args)
+        if args.only in (None, "pipeline"):
+            report["pipeline"] = bench_pipeline(fixtures, workdir, args)
+        report["peak_rss"] = _rss_mb()
+        report["threads_alive"] = threading.active_count()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    print(output)
+    return report
+
+if __name__ == "__main__":
+    main()
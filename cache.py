@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class AssetCache:
+    """Content-addressed disk cache for generated assets with size-based LRU eviction."""
+
+    def __init__(self, root=".cache/assets", max_bytes=2 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(kind, **inputs):
+        """Hashes the inputs that determine an asset. Bytes values are hashed by content."""
+        normalized = {}
+        for name, value in inputs.items():
+            if isinstance(value, (bytes, bytearray)):
+                value = hashlib.sha256(value).hexdigest()
+            normalized[name] = value
+        payload = json.dumps({"kind": kind, "inputs": normalized}, sort_keys=True, default=str)
+        return f"{kind}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]}"
+
+    def _path(self, key, ext):
+        return os.path.join(self.root, f"{key}{ext}")
+
+    def get(self, key, output_path):
+        """Copies a cached asset to `output_path`. Returns the path on a hit, else None."""
+        ext = os.path.splitext(output_path)[1]
+        cached = self._path(key, ext)
+        if not os.path.exists(cached):
+            return None
+        # Touch so eviction sees it as recently used
+        os.utime(cached, None)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        shutil.copyfile(cached, output_path)
+        print(f"   💾 Cache hit: {key}")
+        return output_path
+
+    def put(self, key, path):
+        """Stores a copy of `path` under `key` and evicts old entries if over budget."""
+        cached = self._path(key, os.path.splitext(path)[1])
+        tmp = f"{cached}.{threading.get_ident()}.tmp"
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, cached)
+        self.evict()
+        return cached
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in `max_bytes`."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.root):
+                if name.endswith(".tmp"):
+                    continue
+                full = os.path.join(self.root, name)
+                try:
+                    st = os.stat(full)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, full))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, full in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(full)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+
+    @classmethod
+    def from_env(cls):
+        """Builds the cache from TRENDEY_CACHE_DIR / TRENDEY_CACHE_MAX_MB, or None if disabled."""
+        root = (os.getenv("TRENDEY_CACHE_DIR") or "").strip() or ".cache/assets"
+        if root.lower() in ("off", "none", "0"):
+            return None
+        max_mb = int(os.getenv("TRENDEY_CACHE_MAX_MB") or 2048)
+        return cls(root, max_bytes=max_mb * 1024 * 1024)
+
+class PromptCache:
+    """Persistent prompt -> LLM response cache with a TTL, one JSON file per entry."""
+
+    def __init__(self, root=".cache/llm", ttl=86400):
+        self.root = root
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, model, prompt):
+        digest = hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.root, f"{digest}.json")
+
+    def get(self, model, prompt):
+        path = self._path(model, prompt)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if time.time() - entry.get("created", 0) > self.ttl:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        return entry["response"]
+
+    def put(self, model, prompt, response):
+        path = self._path(model, prompt)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"created": time.time(), "model": model, "prompt": prompt, "response": response}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def from_env(cls):
+        """Builds the cache from TRENDEY_LLM_CACHE_DIR / TRENDEY_LLM_CACHE_TTL (seconds, 0 disables)."""
+        ttl = int(os.getenv("TRENDEY_LLM_CACHE_TTL") or 86400)
+        if ttl <= 0:
+            return None
+        root = (os.getenv("TRENDEY_LLM_CACHE_DIR") or "").strip() or ".cache/llm"
+        return cls(root, ttl=ttl)
@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import uuid
+import random
+import threading
+import subprocess
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tracing import span, file_size
+from media import probe
+
+# Telegram's Bot API rejects uploads above 50 MB (a self-hosted Bot API server allows more)
+TELEGRAM_MAX_BYTES = 50 * 1024 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+def session():
+    """Process-wide pooled HTTP session, so repeated calls reuse TLS connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+class TooLarge(Exception):
+    """The server refused an upload because of its size."""
+
+class MultipartStream:
+    """multipart/form-data body that streams files from disk in chunks.
+
+    Has a known length, so requests sends Content-Length and hands the
+    object to http.client, which pulls it with read() instead of building
+    the whole body in memory.
+    """
+
+    def __init__(self, fields, files, chunk_size=1 << 16):
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self._parts = []
+        for name, value in fields.items():
+            self._parts.append(self._header(name) + b"\r\n" + str(value).encode("utf-8") + b"\r\n")
+        for name, path in files.items():
+            filename = os.path.basename(path).replace('"', "")
+            self._parts.append(self._header(name, filename) + b"Content-Type: application/octet-stream\r\n\r\n")
+            self._parts.append(path)
+            self._parts.append(b"\r\n")
+        self._parts.append(f"--{self.boundary}--\r\n".encode())
+        self.length = sum(os.path.getsize(p) if isinstance(p, str) else len(p) for p in self._parts)
+        self._index = 0
+        self._file = None
+        self._buffered = b""
+
+    def _header(self, name, filename=None):
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        return f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\n".encode()
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self.length
+
+    def _next_chunk(self, size):
+        while self._index < len(self._parts):
+            part = self._parts[self._index]
+            if isinstance(part, bytes):
+                self._index += 1
+                return part
+            if self._file is None:
+                self._file = open(part, "rb")
+            chunk = self._file.read(size)
+            if chunk:
+                return chunk
+            self._file.close()
+            self._file = None
+            self._index += 1
+        return b""
+
+    def read(self, size=-1):
+        size = self.chunk_size if size is None or size < 0 else size
+        out = self._buffered
+        while len(out) < size:
+            chunk = self._next_chunk(size)
+            if not chunk:
+                break
+            out += chunk
+        self._buffered = out[size:]
+        return out[:size]
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+class TelegramDelivery:
+    """Sends finished videos to a Telegram chat.
+
+    Uploads stream from disk over the pooled session with retries and
+    backoff. Files over `max_bytes` go through `fallbacks` in order:
+    "reencode" (to a bitrate that fits), "split" (into parts sent one by
+    one) and "link" (a thumbnail with a download link).
+    """
+
+    def __init__(self, bot_token, chat_id, api_base="https://api.telegram.org", max_bytes=TELEGRAM_MAX_BYTES,
+                 retries=4, backoff=1.0, timeout=(10, 300), fallbacks=("reencode", "split", "link"),
+                 max_parts=10, link_base=None, ffmpeg="ffmpeg", ffprobe="ffprobe", http=None):
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.api_base = api_base.rstrip("/")
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.fallbacks = list(fallbacks)
+        self.max_parts = max_parts
+        self.link_base = link_base
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.http = http or session()
+
+    def _url(self, method):
+        return f"{self.api_base}/bot{self.bot_token}/{method}"
+
+    def call(self, method, fields=None, files=None):
+        """Calls a Bot API method, retrying network errors, 429s and 5xx with backoff."""
+        fields = {"chat_id": self.chat_id, **(fields or {})}
+        for attempt in range(self.retries + 1):
+            body = None
+            retry_after = None
+            try:
+                if files:
+                    # A fresh stream per attempt, since a failed one may be half consumed
+                    body = MultipartStream(fields, files)
+                    response = self.http.post(self._url(method), data=body, timeout=self.timeout,
+                                              headers={"Content-Type": body.content_type})
+                else:
+                    response = self.http.post(self._url(method), data=fields, timeout=self.timeout)
+                if response.status_code == 413:
+                    raise TooLarge(response.text)
+                if response.status_code == 429 or response.status_code >= 500:
+                    try:
+                        retry_after = response.json().get("parameters", {}).get("retry_after")
+                    except ValueError:
+                        pass
+                    raise requests.HTTPError(f"{response.status_code}: {response.text[:200]}", response=response)
+                data = response.json()
+                if not data.get("ok"):
+                    if "too large" in str(data.get("description", "")).lower():
+                        raise TooLarge(data.get("description"))
+                    raise RuntimeError(f"Telegram {method} failed: {data.get('description')}")
+                return data.get("result")
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                if attempt == self.retries:
+                    raise
+                delay = retry_after or self.backoff * (2 ** attempt) * (1 + random.uniform(0, 0.25))
+                print(f"   🔁 Telegram {method} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+            finally:
+                if body is not None:
+                    body.close()
+
+    def send_message(self, text, reply_markup=None):
+        fields = {"text": text, "parse_mode": "Markdown"}
+        if reply_markup:
+            fields["reply_markup"] = json.dumps(reply_markup)
+        return self.call("sendMessage", fields)
+
+    def send_video(self, path, caption=None):
+        fields = {"caption": caption or "", "parse_mode": "Markdown", "supports_streaming": "true"}
+        with span("deliver.upload", bytes=file_size(path)):
+            return self.call("sendVideo", fields, files={"video": path})
+
+    def deliver(self, path, caption, state=None, checkpoint=None):
+        """Delivers `path`, falling back when it's too large. Returns the method used.
+
+        `state` records which parts were already sent; pass the same dict
+        (persisted via `checkpoint(state)`) to resume an interrupted delivery.
+        """
+        state = state if state is not None else {}
+        with span("deliver", bytes=file_size(path)) as s:
+            if os.path.getsize(path) <= self.max_bytes:
+                try:
+                    self.send_video(path, caption)
+                    s["method"] = "direct"
+                    return "direct"
+                except TooLarge:
+                    pass
+            for method in self.fallbacks:
+                try:
+                    if getattr(self, f"_via_{method}")(path, caption, state, checkpoint):
+                        s["method"] = method
+                        return method
+                except TooLarge:
+                    continue
+                except subprocess.SubprocessError as e:
+                    # ffmpeg/ffprobe choking on this file only rules out this method
+                    print(f"   ⚠️ Telegram {method} fallback failed ({e}), trying the next one")
+                    continue
+            raise TooLarge(f"{path} ({os.path.getsize(path) / 1e6:.1f} MB) could not be delivered")
+
+    def _duration(self, path):
+        return probe(path, self.ffprobe)[2]
+
+    def _via_reencode(self, path, caption, state, checkpoint):
+        """Re-encodes to the bitrate that fits the limit, if that keeps watchable quality."""
+        duration = self._duration(path)
+        audio_kbps = 64
+        # 5% headroom for container overhead
+        video_kbps = int(self.max_bytes * 0.95 * 8 / 1000 / duration) - audio_kbps
+        if video_kbps < 300:
+            return False
+        out = f"{os.path.splitext(path)[0]}.tg.mp4"
+        print(f"   🗜️ Re-encoding for Telegram at {video_kbps} kbps...")
+        with span("deliver.reencode", kbps=video_kbps):
+            subprocess.run(
+                [self.ffmpeg, "-y", "-v", "error", "-i", path,
+                 "-vf", "scale='min(1280,iw)':-2", "-c:v", "libx264", "-preset", "veryfast",
+                 "-b:v", f"{video_kbps}k", "-maxrate", f"{video_kbps}k", "-bufsize", f"{video_kbps * 2}k",
+                 "-c:a", "aac", "-b:a", f"{audio_kbps}k", "-movflags", "+faststart", out],
+                check=True
+            )
+        try:
+            if os.path.getsize(out) > self.max_bytes:
+                return False
+            self.send_video(out, caption)
+            return True
+        finally:
+            os.remove(out)
+
+    def _split(self, path, segment_time, pattern, force_keyframes):
+        for stale in self._parts(pattern):
+            os.remove(stale)
+        if force_keyframes:
+            # Re-encode with keyframes exactly at the cut points
+            video = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "20",
+                     "-force_key_frames", f"expr:gte(t,n_forced*{segment_time:.3f})", "-c:a", "copy"]
+        else:
+            video = ["-c", "copy"]
+        subprocess.run(
+            [self.ffmpeg, "-y", "-v", "error", "-i", path, "-map", "0", *video,
+             "-f", "segment", "-segment_time", f"{segment_time:.3f}", "-reset_timestamps", "1",
+             "-segment_format_options", "movflags=+faststart", pattern],
+            check=True
+        )
+        return self._parts(pattern)
+
+    @staticmethod
+    def _parts(pattern):
+        parts = []
+        while os.path.exists(pattern % len(parts)):
+            parts.append(pattern % len(parts))
+        return parts
+
+    def _via_split(self, path, caption, state, checkpoint):
+        """Splits into parts under the limit and sends them in order, skipping parts already sent."""
+        count = int(os.path.getsize(path) / (self.max_bytes * 0.9)) + 1
+        if count > self.max_parts:
+            return False
+        segment_time = self._duration(path) / count
+        pattern = f"{os.path.splitext(path)[0]}.part%02d.mp4"
+        fits = lambda parts: parts and all(os.path.getsize(p) <= self.max_bytes for p in parts)
+
+        with span("deliver.split", parts=count) as s:
+            parts = self._parts(pattern) if state.get("parts_sent") else []
+            if not fits(parts):
+                # Stream copy can only cut at existing keyframes, which may be too far apart
+                parts = self._split(path, segment_time, pattern, force_keyframes=False)
+                if not fits(parts):
+                    s["reencoded"] = True
+                    parts = self._split(path, segment_time, pattern, force_keyframes=True)
+            if not fits(parts) or len(parts) > self.max_parts:
+                return False
+
+        for i in range(state.get("parts_sent", 0), len(parts)):
+            self.send_video(parts[i], f"{caption}\n\n_Part {i + 1}/{len(parts)}_")
+            state["parts_sent"] = i + 1
+            if checkpoint:
+                checkpoint(state)
+        for part in parts:
+            os.remove(part)
+        return True
+
+    def _via_link(self, path, caption, state, checkpoint):
+        """Sends a thumbnail with a link (or the local path) to the full video."""
+        name = os.path.basename(path)
+        where = f"{self.link_base.rstrip('/')}/{name}" if self.link_base else f"`{path}`"
+        text = f"{caption}\n\n📦 Video is {os.path.getsize(path) / 1e6:.0f} MB, too large for Telegram: {where}"
+        thumb = f"{os.path.splitext(path)[0]}.thumb.jpg"
+        try:
+            subprocess.run(
+                [self.ffmpeg, "-y", "-v", "error", "-ss", f"{self._duration(path) / 2:.3f}", "-i", path,
+                 "-frames:v", "1", "-vf", "scale='min(1280,iw)':-2", thumb],
+                check=True
+            )
+        except subprocess.SubprocessError as e:
+            # Last resort: the link alone still gets the video to the chat
+            print(f"   ⚠️ Thumbnail failed ({e}), sending the link as text")
+            self.send_message(text)
+            return True
+        try:
+            with span("deliver.upload", bytes=file_size(thumb)):
+                self.call("sendPhoto", {"caption": text, "parse_mode": "Markdown"}, files={"photo": thumb})
+        finally:
+            os.remove(thumb)
+        return True
+
+    @classmethod
+    def from_env(cls):
+        """Builds a delivery from TELEGRAM_BOT_TOKEN / TELEGRAM_CHAT_ID, or None without credentials."""
+        bot_token = (os.getenv("TELEGRAM_BOT_TOKEN") or "").strip()
+        chat_id = (os.getenv("TELEGRAM_CHAT_ID") or "").strip()
+        if not bot_token or not chat_id:
+            return None
+        fallbacks = (os.getenv("TRENDEY_TG_FALLBACK") or "reencode,split,link").split(",")
+        ffmpeg = (os.getenv("FFMPEG_BINARY") or "").strip() or "ffmpeg"
+        return cls(
+            bot_token, chat_id,
+            api_base=(os.getenv("TELEGRAM_API_BASE") or "").strip() or "https://api.telegram.org",
+            max_bytes=int(float(os.getenv("TRENDEY_TG_MAX_MB") or 50) * 1024 * 1024),
+            retries=int(os.getenv("TRENDEY_TG_RETRIES") or 4),
+            fallbacks=[f.strip() for f in fallbacks if f.strip()],
+            link_base=(os.getenv("TRENDEY_DELIVERY_LINK_BASE") or "").strip() or None,
+            ffmpeg=ffmpeg,
+            ffprobe=(os.getenv("FFPROBE_BINARY") or "").strip() or "ffprobe",
+        )
@@ -1,38 +1,94 @@
 import os
+import re
 import json
-import requests
-import asyncio
 import time
-import edge_tts
-from gradio_client import Client
+import subprocess
+import asyncio
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# The client libraries (huggingface_hub, gradio_client, edge_tts) are imported
+# where they're first used, so importing this module stays cheap.
+from cache import file_digest
+from jobs import JobTracker
+from backends import BackendPool, Cancelled, await_future
+from tracing import span, file_size, propagate
+from models import MODELS, ModelCache, resolve_model
+from fetch import ResultFetcher, CONTAINER_MAGIC
 
-from huggingface_hub import InferenceClient
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
 
 class ScriptEngine:
     """Uses HF Inference API to generate topics and scripts."""
-    def __init__(self, api_key=None):
+    model = "Qwen/Qwen2.5-72B-Instruct"
+
+    def __init__(self, api_key=None, prompt_cache=None):
+        from huggingface_hub import InferenceClient
         self.api_key = api_key or (os.getenv("HF_TOKEN") or "").strip()
         # Use InferenceClient which handles the router/endpoint logic automatically
-        self.client = InferenceClient("Qwen/Qwen2.5-72B-Instruct", token=self.api_key)
+        self.client = InferenceClient(self.model, token=self.api_key)
+        self.prompt_cache = prompt_cache
+
+    def _cached(self, prompt):
+        if self.prompt_cache:
+            response = self.prompt_cache.get(self.model, prompt)
+            if response is not None:
+                print("   💾 LLM cache hit")
+                return response
+        return None
+
+    def _remember(self, prompt, response):
+        # Errors are returned as text, never cache them
+        if self.prompt_cache and not response.startswith("Error"):
+            self.prompt_cache.put(self.model, prompt, response)
 
-    def query(self, prompt):
+    def query(self, prompt, remember=True):
         if not self.api_key: return "Error: No HF_TOKEN"
-        try:
-            # Simplified non-streaming call for better stability
-            response = self.client.chat_completion(
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=1500
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            return f"Error from HF API: {str(e)}"
+        cached = self._cached(prompt)
+        if cached is not None:
+            return cached
+        with span("llm.query", prompt_chars=len(prompt)) as s:
+            try:
+                # Simplified non-streaming call for better stability
+                response = self.client.chat_completion(
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=1500
+                )
+                content = response.choices[0].message.content.strip()
+                s["bytes"] = len(content.encode("utf-8"))
+                if remember:
+                    self._remember(prompt, content)
+                return content
+            except Exception as e:
+                s["error"] = str(e)
+                return f"Error from HF API: {str(e)}"
+
+    def _topic_prompt(self, n=1):
+        if n == 1:
+            return "Search trends for 2026. Give me ONE high-CPM, viral topic for a 60-second video. Just the topic name."
+        return (f"Search trends for 2026. Give me {n} different high-CPM, viral topics for a 60-second video. "
+                "Just the topic names, one per line, no numbering.")
+
+    @staticmethod
+    def _parse_topics(response, n):
+        # Drop list markers like "1.", "2)", "-" the model adds despite instructions
+        topics = [re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip().strip('"') for line in response.splitlines()]
+        return [t for t in topics if t][:n]
 
     def get_viral_topic(self):
-        prompt = "Search trends for 2026. Give me ONE high-CPM, viral topic for a 60-second video. Just the topic name."
-        return self.query(prompt)
+        return self.query(self._topic_prompt())
 
-    def generate_full_script(self, topic):
-        prompt = f"""Create a 60s YouTube script for '{topic}'. 
+    def get_viral_topics(self, n=3):
+        """Brainstorms `n` topics in a single request."""
+        return self._parse_topics(self.query(self._topic_prompt(n)), n)
+
+    def _script_prompt(self, topic):
+        return f"""Create a 60s YouTube script for '{topic}'. 
         Return ONLY valid JSON with this structure:
         {{
             "title": "...",
@@ -44,9 +100,13 @@ class ScriptEngine:
                 {{"time": 50, "position": "center", "action": "outro"}}
             ]
         }}
+        avatar_schedule positions are "center", "corner" or "hidden" (b-roll only).
         """
-        response = self.query(prompt)
+
+    def _parse_script(self, response, topic, prompt=None):
+        """Parses a script reply, falling back to a stub script. Only a reply that parses is cached under `prompt`."""
         print(f"DEBUG: LLM Response length: {len(response)}")
+        raw = response
         
         # Robust extraction
         try:
@@ -58,7 +118,7 @@ class ScriptEngine:
                 end = response.rfind("}") + 1
                 response = response[start:end]
             
-            return json.loads(response)
+            script = json.loads(response)
         except Exception as e:
             print(f"❌ JSON Parse Error: {e}\nResponse was: {response[:200]}...")
             # Return a fallback script to prevent crash
@@ -68,87 +128,480 @@ class ScriptEngine:
                 "b_roll_prompts": [f"{topic} cinematic visual"],
                 "avatar_schedule": [{"time": 0, "position": "center", "action": "intro"}]
             }
+        if prompt and self.prompt_cache and self.prompt_cache.get(self.model, prompt) is None:
+            self._remember(prompt, raw)
+        return script
+
+    def generate_full_script(self, topic):
+        prompt = self._script_prompt(topic)
+        return self._parse_script(self.query(prompt, remember=False), topic, prompt)
+
+class AsyncScriptEngine(ScriptEngine):
+    """ScriptEngine on AsyncInferenceClient, so topic and script requests can run concurrently."""
+    def __init__(self, api_key=None, prompt_cache=None):
+        from huggingface_hub import AsyncInferenceClient
+        super().__init__(api_key, prompt_cache)
+        self.async_client = AsyncInferenceClient(self.model, token=self.api_key)
+
+    async def aquery(self, prompt, remember=True):
+        if not self.api_key: return "Error: No HF_TOKEN"
+        cached = self._cached(prompt)
+        if cached is not None:
+            return cached
+        with span("llm.query", prompt_chars=len(prompt), mode="async") as s:
+            try:
+                response = await self.async_client.chat_completion(
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=1500
+                )
+                content = response.choices[0].message.content.strip()
+                s["bytes"] = len(content.encode("utf-8"))
+                if remember:
+                    self._remember(prompt, content)
+                return content
+            except Exception as e:
+                s["error"] = str(e)
+                return f"Error from HF API: {str(e)}"
+
+    async def agenerate_full_script(self, topic):
+        prompt = self._script_prompt(topic)
+        return self._parse_script(await self.aquery(prompt, remember=False), topic, prompt)
+
+    def generate_scripts(self, topics):
+        """Requests scripts for every topic concurrently. Returns a list in the same order."""
+        async def gather():
+            return await asyncio.gather(*(self.agenerate_full_script(t) for t in topics))
+        return asyncio.run(gather())
 
 class RemoteAssetEngine:
     """Triggering HF Spaces for Video and LipSync."""
-    def __init__(self, video_space, lipsync_space, hf_token=None):
+    def __init__(self, video_space, lipsync_space, hf_token=None, max_video_jobs=3, cache=None,
+                 tracker=None, video_timeout=600.0, client_factory=None, hedge_after=None, fetcher=None):
         self.hf_token = hf_token
-        self.video_client = Client(video_space, token=self.hf_token) if video_space else None
-        self.lipsync_client = Client(lipsync_space, token=self.hf_token) if lipsync_space else None
+        self.max_video_jobs = max_video_jobs
+        self.cache = cache
+        # One poll loop shared by every outstanding remote job
+        self.tracker = tracker or JobTracker()
+        self.video_timeout = video_timeout
+        self.client_factory = client_factory or self._default_client
+        # Results are streamed from the Space's file URLs rather than downloaded by gradio_client
+        self.fetcher = fetcher or ResultFetcher(token=hf_token)
+        # Each role may list several Spaces (comma-separated); jobs are routed,
+        # hedged and failed over between them.
+        self.video_pool = BackendPool("video", video_space, default_latency=300.0, hedge_after=hedge_after) if video_space else None
+        self.lipsync_pool = BackendPool("avatar", lipsync_space, default_latency=120.0, hedge_after=hedge_after) if lipsync_space else None
+        # Video sessions are leased out one job at a time and reused across
+        # calls (and topics), capping jobs in flight at `max_video_jobs` per
+        # Space, so a hedge or failover never queues behind the slow Space's jobs.
+        # Clients are created on first use so a dead Space only fails its own jobs.
+        self._video_slots = {}
+        self._idle_video_clients = {}
+        self._lipsync_clients = {}
+        self._pool_lock = threading.Lock()
+
+    @staticmethod
+    def _default_client(space, token=None):
+        from gradio_client import Client
+        return Client(space, hf_token=token, download_files=False)
+
+    @contextmanager
+    def _video_session(self, backend, cancel=None):
+        """Leases an exclusive video session as {"client", "busy_until"}; /status_refresh reports on the caller's session.
+
+        Wan has no cancel endpoint: when an attempt fails or loses a hedge
+        its job keeps running remotely. That session is dropped instead of
+        reused, and until the job's ETA (`busy_until`) passes it keeps its
+        slot and counts as an orphan in the Space's routing score.
+        """
+        space = backend.space
+        with self._pool_lock:
+            slots = self._video_slots.setdefault(space, threading.BoundedSemaphore(self.max_video_jobs))
+        # An attempt still waiting for a slot gives up once another backend has won
+        while not slots.acquire(timeout=0.5):
+            if cancel is not None and cancel.is_set():
+                raise Cancelled()
+        try:
+            with self._pool_lock:
+                idle = self._idle_video_clients.setdefault(space, [])
+                client = idle.pop() if idle else None
+            if client is None:
+                client = self.client_factory(space, token=self.hf_token)
+            lease = {"client": client, "busy_until": None}
+            try:
+                yield lease
+            except BaseException:
+                remaining = (lease["busy_until"] or 0) - time.monotonic()
+                if remaining > 0:
+                    self._orphan(backend, slots, remaining)
+                    slots = None
+                raise
+            with self._pool_lock:
+                idle.append(client)
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def _orphan(self, backend, slots, seconds):
+        """Holds a slot (and counts the job against `backend`) while an abandoned remote job runs out."""
+        print(f"   🧟 {backend.space}: abandoned job keeps running remotely, holding its slot for {seconds:.0f}s")
+        self.video_pool.orphaned(backend, +1)
+
+        def expire():
+            self.video_pool.orphaned(backend, -1)
+            slots.release()
+        timer = threading.Timer(seconds, expire)
+        timer.daemon = True
+        timer.start()
+
+    def _lipsync_client(self, space):
+        with self._pool_lock:
+            client = self._lipsync_clients.get(space)
+        if client is None:
+            client = self.client_factory(space, token=self.hf_token)
+            with self._pool_lock:
+                client = self._lipsync_clients.setdefault(space, client)
+        return client
+
+    def generate_video_clips(self, prompts, output_paths):
+        """Submits every b-roll prompt at once, keeping at most `max_video_jobs` in flight per Space."""
+        if len(prompts) != len(output_paths):
+            raise ValueError("prompts and output_paths must have the same length")
+        if not prompts:
+            raise ValueError("No b-roll prompts to render")
+        if len(prompts) == 1:
+            return [self.generate_video_clip(prompts[0], output_paths[0])]
+
+        print(f"🎞️ Rendering {len(prompts)} b-roll clips ({self.max_video_jobs} in flight)")
+        with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+            return list(pool.map(propagate(self.generate_video_clip), prompts, output_paths))
+
     def generate_video_clip(self, prompt, output_path):
         """Asynchronous generation with status polling for Wan-2.1."""
         print(f"🎬 Initializing Async Video Generation: {prompt}")
-        try:
-            # Step 1: Trigger the generation
-            # API: /t2v_generation_async (prompt, size, watermark, seed)
-            print("   🚀 Triggering /t2v_generation_async...")
-            trigger_result = self.video_client.predict(
+        with span("broll.generate", prompt=prompt[:80]) as s:
+            size, watermark, seed = "1280*720", True, -1.0
+            cache_key = None
+            if self.cache:
+                cache_key = self.cache.key("broll", prompt=prompt, size=size, watermark=watermark, seed=seed)
+                if self.cache.get(cache_key, output_path):
+                    s.update(cached=True, bytes=file_size(output_path))
+                    return output_path
+
+            def attempt(backend, cancel):
+                with self._video_session(backend, cancel) as lease:
+                    if cancel.is_set():
+                        raise Cancelled()
+                    return self._render_video(lease, backend, prompt, size, watermark, seed, cancel, s)
+
+            try:
+                video_file = self.video_pool.run(attempt, f"b-roll '{prompt[:40]}'")
+                print(f"   ✅ Video generation complete: {video_file}")
+                self._store(video_file, output_path, cache_key)
+                s["bytes"] = file_size(output_path)
+                return output_path
+
+            except Exception as e:
+                print(f"❌ Video Generation Failed: {str(e)}")
+                raise e
+
+    def _render_video(self, lease, backend, prompt, size, watermark, seed, cancel, s):
+        """Runs one Wan job on a leased session and returns gradio's result (path or FileData)."""
+        client = lease["client"]
+        # Step 1: Trigger the generation
+        # API: /t2v_generation_async (prompt, size, watermark, seed)
+        print("   🚀 Triggering /t2v_generation_async...")
+        with span("broll.trigger"):
+            job = client.submit(
                 prompt,         # prompt
-                "1280*720",     # size
-                True,           # watermark_wan
-                -1.0,           # seed
+                size,           # size
+                watermark,      # watermark_wan
+                seed,           # seed
                 api_name="/t2v_generation_async"
             )
-            print(f"   🕒 Job started. Estimated wait: {trigger_result[1]}s")
-            
-            # Step 2: Poll for status
-            max_retries = 40 # Up to 10 minutes
-            for i in range(max_retries):
-                time.sleep(15) 
-                print(f"   🔄 Polling status (Attempt {i+1})...")
-                
-                status = self.video_client.predict(api_name="/status_refresh")
-                video_info = status[0]
-                if video_info and isinstance(video_info, dict) and video_info.get("video"):
-                    video_file = video_info["video"]
-                    print(f"   ✅ Video generation complete: {video_file}")
-                    os.replace(video_file, output_path)
-                    return output_path
-                
-                progress = status[3] if len(status) > 3 else "Unknown"
-                print(f"   ⏳ Progress: {progress}%")
-                
-            raise Exception("Video generation timed out.")
-            
-        except Exception as e:
-            print(f"❌ Video Generation Failed: {str(e)}")
-            raise e
+            # Position in the Space's gradio queue steers routing, as for the avatar
+            backend.queue_depth = getattr(job.status(), "rank", None) or 0
+            trigger_result = job.result()
+        eta = _as_float(trigger_result[1]) if len(trigger_result) > 1 else None
+        s["eta"] = eta
+        print(f"   🕒 Job started. Estimated wait: {eta}s")
+        # The Space is busy with this job until then, even if we stop waiting for it
+        lease["busy_until"] = time.monotonic() + min(eta or self.video_timeout, self.video_timeout)
+
+        # Step 2: Poll for status, scheduled from the ETA and reported progress
+        def poll():
+            status = client.predict(api_name="/status_refresh")
+            video_info = status[0]
+            if video_info and isinstance(video_info, dict) and video_info.get("video"):
+                return video_info["video"], 100
+            return None, _as_float(status[3]) if len(status) > 3 else None
+
+        future = self.tracker.track(f"b-roll '{prompt[:40]}'", poll, eta=eta, timeout=self.video_timeout)
+        return await_future(future, cancel)
+
+    def _store(self, result, output_path, cache_key=None):
+        """Fetches a gradio result (local file or URL) into place and records it in the cache."""
+        self.fetcher.fetch(result, output_path, magic=CONTAINER_MAGIC)
+        if self.cache and cache_key:
+            self.cache.put(cache_key, output_path)
+        return output_path
 
     def generate_talking_avatar(self, image_path, audio_path, output_path):
         """Calls LivePortrait with fallback and robust return handling."""
         print(f"👤 Syncing Avatar {image_path} with Audio {audio_path}")
         # Args: [input_image, input_audio, flag_do_lip_sync]
         args = [image_path, audio_path, True]
-        
-        for name in ["/predict", "/process"]:
+        with span("avatar.generate", retries=0) as s:
+            cache_key = None
+            if self.cache:
+                cache_key = self.cache.key("avatar", image=file_digest(image_path), audio=file_digest(audio_path), lip_sync=True)
+                if self.cache.get(cache_key, output_path):
+                    s.update(cached=True, bytes=file_size(output_path))
+                    return output_path
+
             try:
-                result = self.lipsync_client.predict(*args, api_name=name)
-                file_path = result
-                if isinstance(result, dict): file_path = result.get("video") or result.get("path")
-                elif isinstance(result, (list, tuple)): file_path = result[0]
-                os.replace(file_path, output_path)
+                file_path = self.lipsync_pool.run(lambda backend, cancel: self._render_avatar(backend, args, cancel, s), "avatar")
+                self._store(file_path, output_path, cache_key)
+                s["bytes"] = file_size(output_path)
                 return output_path
+            except Exception as e:
+                print(f"❌ Avatar Generation Failed: {str(e)}")
+                raise e
+
+    def _render_avatar(self, backend, args, cancel, s):
+        """Tries the known LivePortrait endpoints on one backend and returns gradio's result."""
+        client = self._lipsync_client(backend.space)
+
+        def call(label, **endpoint):
+            job = client.submit(*args, **endpoint)
+            status = job.status()
+            backend.queue_depth = getattr(status, "rank", None) or 0
+            # A path, URL or FileData (or a list/dict holding one); the fetcher resolves it
+            return await_future(self.tracker.track_gradio(f"avatar {label}", job), cancel, on_cancel=job.cancel)
+
+        for name in ["/predict", "/process"]:
+            try:
+                file_path = call(name, api_name=name)
+                s["endpoint"] = name
+                return file_path
+            except Cancelled:
+                raise
             except Exception:
+                s["retries"] += 1
                 continue
-        
-        try:
-            print("   ⚠️ Avatar API names failed. Falling back to fn_index=0...")
-            result = self.lipsync_client.predict(*args, fn_index=0)
-            file_path = result
-            if isinstance(result, dict): file_path = result.get("video") or result.get("path")
-            elif isinstance(result, (list, tuple)): file_path = result[0]
-            os.replace(file_path, output_path)
-            return output_path
-        except Exception as e:
-            print(f"❌ Avatar Generation Failed: {str(e)}")
-            raise e
+
+        print("   ⚠️ Avatar API names failed. Falling back to fn_index=0...")
+        file_path = call("fn_index=0", fn_index=0)
+        s["endpoint"] = "fn_index=0"
+        return file_path
+
+# Edge-TTS streams constant-bitrate 48 kbps mono MP3, so byte counts give durations
+EDGE_TTS_BYTES_PER_SEC = 48000 / 8
+
+def split_sentences(text):
+    """Splits a voiceover into sentences on terminal punctuation."""
+    return [part.strip() for part in re.split(r"(?<=[.!?…])\s+", text.strip()) if part.strip()]
 
 class AudioEngine:
     """Local TTS using Edge-TTS (No GPU needed)."""
+    def __init__(self, voice="en-US-ChristopherNeural", cache=None, chunked=False, max_concurrency=4):
+        self.voice = voice
+        self.cache = cache
+        self.chunked = chunked
+        self.max_concurrency = max_concurrency
+        # One event loop shared by every synthesis call, instead of asyncio.run per call
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def _run(self, coro):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="tts-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
     async def _gen(self, text, path):
-        communicate = edge_tts.Communicate(text, "en-US-ChristopherNeural")
+        import edge_tts
+        communicate = edge_tts.Communicate(text, self.voice)
         await communicate.save(path)
 
+    async def _synthesize(self, text):
+        """Streams one chunk, returning (mp3 bytes, word boundaries relative to the chunk)."""
+        import edge_tts
+        try:
+            communicate = edge_tts.Communicate(text, self.voice, boundary="WordBoundary")
+        except TypeError:
+            # Older edge-tts always emits word boundaries and has no `boundary` argument
+            communicate = edge_tts.Communicate(text, self.voice)
+        audio, words = bytearray(), []
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio.extend(chunk["data"])
+            elif chunk["type"] == "WordBoundary":
+                start = chunk["offset"] / 1e7
+                words.append({"text": chunk["text"], "start": start, "end": start + chunk["duration"] / 1e7})
+        return bytes(audio), words
+
+    async def _gen_chunked(self, text, path):
+        sentences = split_sentences(text)
+        limit = asyncio.Semaphore(self.max_concurrency)
+
+        async def one(sentence):
+            async with limit:
+                return await self._synthesize(sentence)
+
+        parts = await asyncio.gather(*(one(sentence) for sentence in sentences))
+
+        # MP3 frames concatenate cleanly, so the chunks are stitched without re-encoding
+        timings = {"sentences": [], "words": []}
+        offset = 0.0
+        with open(path, "wb") as f:
+            for sentence, (audio, words) in zip(sentences, parts):
+                f.write(audio)
+                duration = len(audio) / EDGE_TTS_BYTES_PER_SEC
+                timings["sentences"].append({"text": sentence, "start": offset, "end": offset + duration})
+                timings["words"].extend({**w, "start": w["start"] + offset, "end": w["end"] + offset} for w in words)
+                offset += duration
+        timings["duration"] = offset
+        with open(self.timings_path(path), "w") as f:
+            json.dump(timings, f, indent=2)
+
+    @staticmethod
+    def timings_path(path):
+        return f"{os.path.splitext(path)[0]}.timings.json"
+
+    @classmethod
+    def load_timings(cls, path):
+        """Word/sentence timestamps written next to a chunked voiceover, or None."""
+        try:
+            with open(cls.timings_path(path)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
     def generate(self, text, path):
-        asyncio.run(self._gen(text, path))
+        with span("tts.generate", chars=len(text), voice=self.voice, chunked=self.chunked) as s:
+            kind = "tts-chunked" if self.chunked else "tts"
+            cache_key = None
+            if self.cache:
+                cache_key = self.cache.key(kind, voice=self.voice, text=text)
+                if self.cache.get(cache_key, path) and (not self.chunked or self.cache.get(cache_key, self.timings_path(path))):
+                    s.update(cached=True, bytes=file_size(path))
+                    return path
+            if self.chunked:
+                self._run(self._gen_chunked(text, path))
+            else:
+                self._run(self._gen(text, path))
+            if cache_key:
+                self.cache.put(cache_key, path)
+                if self.chunked:
+                    self.cache.put(cache_key, self.timings_path(path))
+            s["bytes"] = file_size(path)
         return path
+
+class VideoGenEngine:
+    """Local text-to-video with diffusers, backing the Gradio app.
+
+    Pipelines come from a shared ModelCache, so switching models offloads the
+    previous one to CPU instead of throwing it away.
+    """
+    music_model = "facebook/musicgen-small"
+
+    def __init__(self, model_type="wan-2.1-1.3b", models=None, ffmpeg=None):
+        self.model_type = resolve_model(model_type)
+        self.models = models or ModelCache.from_env()
+        self.ffmpeg = ffmpeg or (os.getenv("FFMPEG_BINARY") or "").strip() or "ffmpeg"
+        self.pipe = None
+        self._music = None
+
+    @staticmethod
+    def _load(key):
+        import torch
+        import diffusers
+        spec = MODELS[key]
+        pipeline_cls = getattr(diffusers, spec["pipeline"])
+        dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
+        return pipeline_cls.from_pretrained(spec["repo"], torch_dtype=dtype)
+
+    def load_model(self, model_key=None):
+        """Makes `model_key` (default: the current model) the active pipeline."""
+        key = resolve_model(model_key or self.model_type)
+        with span("local.load_model", model=key):
+            self.pipe = self.models.get(key, lambda: self._load(key))
+        self.model_type = key
+        return self.pipe
+
+    def generate(self, prompt, negative_prompt=None, width=832, height=480, num_frames=81, steps=50,
+                 guidance=6.0, seed=-1, progress=None):
+        """Renders frames for `prompt`. Returns (frames, seed used, seconds taken).
+
+        `progress(step, total)` is called after every denoising step.
+        """
+        import torch
+        pipe = self.load_model()
+        spec = MODELS[self.model_type]
+        # Snap to the sizes the model was trained on instead of failing deep inside the pipeline
+        step = spec["frame_step"]
+        num_frames = max(1, (int(num_frames) - 1) // step * step + 1)
+        width = max(spec["size_step"], int(width) // spec["size_step"] * spec["size_step"])
+        height = max(spec["size_step"], int(height) // spec["size_step"] * spec["size_step"])
+        if seed is None or int(seed) < 0:
+            seed = int.from_bytes(os.urandom(4), "little") & 0x7FFFFFFF
+        seed = int(seed)
+        generator = torch.Generator(device="cpu").manual_seed(seed)
+
+        def on_step(pipeline, i, timestep, callback_kwargs):
+            if progress:
+                progress(i + 1, steps)
+            return callback_kwargs
+
+        with span("local.generate", model=self.model_type, width=width, height=height,
+                  frames=num_frames, steps=steps) as s:
+            result = pipe(
+                prompt=prompt,
+                negative_prompt=negative_prompt or None,
+                width=width,
+                height=height,
+                num_frames=num_frames,
+                num_inference_steps=int(steps),
+                guidance_scale=float(guidance),
+                generator=generator,
+                callback_on_step_end=on_step,
+            )
+        return result.frames[0], seed, s.duration
+
+    def generate_audio_bg(self, prompt, output_path=None, seconds=8):
+        """Generates background music for `prompt` with MusicGen and writes it as WAV."""
+        import wave
+        import numpy as np
+        if self._music is None:
+            from transformers import pipeline
+            self._music = pipeline("text-to-audio", model=self.music_model, device=self.models._device())
+        with span("local.music", model=self.music_model):
+            out = self._music(f"background music for: {prompt}",
+                              forward_params={"max_new_tokens": int(seconds * 50)})
+        samples = np.clip(np.asarray(out["audio"]).reshape(-1), -1.0, 1.0)
+        output_path = output_path or os.path.join("temp", f"music_{int(time.time() * 1000)}.wav")
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with wave.open(output_path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(int(out["sampling_rate"]))
+            f.writeframes((samples * 32767).astype("<i2").tobytes())
+        return output_path
+
+    def save_result(self, frames, output_path, audio_path=None):
+        """Encodes frames to MP4 at the model's frame rate, muxing in `audio_path` if given."""
+        from diffusers.utils import export_to_video
+        fps = MODELS[self.model_type]["fps"]
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        if not audio_path:
+            return export_to_video(frames, output_path, fps=fps)
+        silent = f"{os.path.splitext(output_path)[0]}.silent.mp4"
+        export_to_video(frames, silent, fps=fps)
+        subprocess.run(
+            [self.ffmpeg, "-y", "-v", "error", "-i", silent, "-i", audio_path,
+             "-map", "0:v", "-map", "1:a", "-c:v", "copy", "-c:a", "aac", "-shortest", output_path],
+            check=True
+        )
+        os.remove(silent)
+        return output_path
@@ -0,0 +1,199 @@
+import os
+import re
+import errno
+import shutil
+import hashlib
+import threading
+from urllib.parse import urlparse
+
+import requests
+
+from delivery import session
+from tracing import span, propagate
+
+# MP4/MOV files carry an "ftyp" box in their first bytes; WebM/MKV start with the EBML magic
+CONTAINER_MAGIC = (b"ftyp", b"\x1a\x45\xdf\xa3")
+
+# The HF token only goes to Hugging Face itself and its Spaces, never to arbitrary result URLs
+TOKEN_HOSTS = ("huggingface.co", "hf.space")
+
+def token_host(url):
+    """Whether `url` points at a host that should receive the HF token."""
+    host = (urlparse(url).hostname or "").lower()
+    return any(host == h or host.endswith("." + h) for h in TOKEN_HOSTS)
+
+def handoff(src, dst):
+    """Moves `src` to `dst`: a rename on the same filesystem, a copy and delete across devices."""
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    try:
+        os.replace(src, dst)
+        return dst
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # Copy next to the destination first so readers never see a half-written file
+    tmp = f"{dst}.{threading.get_ident()}.tmp"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+    try:
+        os.remove(src)
+    except OSError:
+        pass
+    return dst
+
+def result_source(result):
+    """(url, local path, expected size) of a gradio result: a path, a URL, or a FileData dict/object."""
+    if isinstance(result, (list, tuple)):
+        result = result[0]
+    if isinstance(result, dict):
+        if isinstance(result.get("video"), (dict, str)):
+            return result_source(result["video"])
+        url, path, size = result.get("url"), result.get("path"), result.get("size")
+    elif isinstance(result, str):
+        url, path, size = (result, None, None) if re.match(r"https?://", result) else (None, result, None)
+    else:
+        url, path, size = getattr(result, "url", None), getattr(result, "path", None), getattr(result, "size", None)
+    if path and os.path.exists(path):
+        # Already downloaded by gradio_client
+        return None, path, size
+    if not url:
+        raise ValueError(f"Result has no downloadable file: {result!r}")
+    return url, None, size
+
+class VerificationError(Exception):
+    """A download didn't match its expected size or checksum."""
+
+class Download:
+    """A file being streamed to `path` via `<path>.part`."""
+
+    def __init__(self, path, expected_size=None):
+        self.path = path
+        self.partial_path = f"{path}.part"
+        self.expected_size = expected_size
+        self.received = 0
+        self.sha256 = None
+        self.error = None
+        self._cv = threading.Condition()
+        self._done = False
+
+    def _progress(self, received):
+        with self._cv:
+            self.received = received
+            self._cv.notify_all()
+
+    def _finish(self, error=None):
+        with self._cv:
+            self.error = error
+            self._done = True
+            self._cv.notify_all()
+
+    def result(self, timeout=None):
+        """Waits for completion and returns the final path."""
+        with self._cv:
+            self._cv.wait_for(lambda: self._done, timeout)
+            if self.error:
+                raise self.error
+            if not self._done:
+                raise TimeoutError(f"Download of {self.path} still running")
+            return self.path
+
+class ResultFetcher:
+    """Hands gradio results over to their output paths without buffering them in memory.
+
+    Local results are renamed into place (copied across devices). Remote
+    ones are streamed in chunks, resumed with Range requests after a dropped
+    connection, and checked against the expected size and, when known, the
+    SHA-256 (given, or taken from an LFS-style ETag).
+    """
+
+    def __init__(self, token=None, chunk_size=1 << 20, retries=3, timeout=(10, 120), http=None):
+        self.token = token
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.timeout = timeout
+        self.http = http or session()
+
+    def start(self, result, output_path, sha256=None, magic=None):
+        """Begins fetching `result` into `output_path` and returns its Download.
+
+        With `magic`, a download whose first bytes contain none of those
+        signatures (say, an HTML error page) fails as soon as they arrive.
+        """
+        url, path, size = result_source(result)
+        download = Download(output_path, expected_size=size)
+        if path:
+            try:
+                handoff(path, output_path)
+                download._progress(os.path.getsize(output_path))
+                download._finish()
+            except Exception as e:
+                download._finish(e)
+            return download
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        threading.Thread(target=propagate(self._stream), args=(url, download, sha256, magic),
+                         name="fetch", daemon=True).start()
+        return download
+
+    def fetch(self, result, output_path, sha256=None, magic=None):
+        """Fetches `result` into `output_path` and returns the path once verified."""
+        return self.start(result, output_path, sha256, magic).result()
+
+    def _stream(self, url, download, sha256, magic):
+        try:
+            with span("fetch.download", url=url[-80:]) as s:
+                self._download(url, download, sha256, magic)
+                s.update(bytes=download.received, sha256=download.sha256)
+            os.replace(download.partial_path, download.path)
+            download._finish()
+        except Exception as e:
+            try:
+                os.remove(download.partial_path)
+            except OSError:
+                pass
+            download._finish(e)
+
+    def _download(self, url, download, sha256, magic):
+        h = hashlib.sha256()
+        head = b""
+        received = 0
+        total = download.expected_size
+        etag = None
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token and token_host(url) else {}
+        with open(download.partial_path, "wb") as f:
+            for attempt in range(self.retries + 1):
+                range_headers = {**headers, "Range": f"bytes={received}-"} if received else headers
+                try:
+                    with self.http.get(url, headers=range_headers, stream=True, timeout=self.timeout) as response:
+                        response.raise_for_status()
+                        if received and response.status_code != 206:
+                            # Server ignored the Range header: start over
+                            f.seek(0)
+                            f.truncate()
+                            h = hashlib.sha256()
+                            received = 0
+                        if not received:
+                            length = response.headers.get("Content-Length")
+                            total = total or (int(length) if length else None)
+                            etag = (response.headers.get("X-Linked-Etag") or response.headers.get("ETag") or "").strip('W/"')
+                        for chunk in response.iter_content(self.chunk_size):
+                            if magic and len(head) < 64:
+                                head += chunk[:64]
+                                if len(head) >= 12 and not any(m in head[:64] for m in magic):
+                                    raise VerificationError(f"{url}: not a media file ({head[:32]!r})")
+                            f.write(chunk)
+                            h.update(chunk)
+                            received += len(chunk)
+                            f.flush()
+                            download._progress(received)
+                    break
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                    if attempt == self.retries:
+                        raise
+                    print(f"   🔁 Download interrupted at {received} bytes ({e}), resuming")
+
+        download.sha256 = h.hexdigest()
+        if total is not None and received != total:
+            raise VerificationError(f"{url}: expected {total} bytes, got {received}")
+        expected = sha256 or (etag if re.fullmatch(r"[0-9a-f]{64}", etag or "") else None)
+        if expected and expected != download.sha256:
+            raise VerificationError(f"{url}: checksum mismatch")
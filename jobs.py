@@ -0,0 +1,153 @@
+import heapq
+import random
+import threading
+import time
+import contextvars
+from concurrent.futures import Future, InvalidStateError
+
+from tracing import span
+
+class TrackedJob:
+    """A remote job registered with a JobTracker."""
+
+    def __init__(self, name, poll_fn, eta=None, timeout=600.0):
+        self.name = name
+        self.poll_fn = poll_fn
+        self.eta = eta
+        self.timeout = timeout
+        self.future = Future()
+        self.submitted = time.monotonic()
+        self.progress = None
+        self.interval = None
+        self.polls = 0
+        # Polled from the tracker thread, but its spans belong to the run that registered it
+        self.context = contextvars.copy_context()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.submitted
+
+    def settle(self, result=None, error=None):
+        """Resolves the future, unless it was cancelled (say, a hedge loser) while its poll ran."""
+        try:
+            if error is not None:
+                self.future.set_exception(error)
+            else:
+                self.future.set_result(result)
+        except InvalidStateError:
+            pass
+
+class JobTracker:
+    """Polls many outstanding remote jobs from a single loop.
+
+    Each job supplies a `poll_fn` returning `(result, progress)`: a non-None
+    `result` completes the job, `progress` (0-100 or None) steers when the
+    next poll happens. Polls are scheduled from the job's ETA and observed
+    progress rate, with exponential backoff and jitter in between.
+    """
+
+    def __init__(self, min_interval=2.0, max_interval=30.0, backoff=1.5, jitter=0.1):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.latencies = {}
+        self._heap = []
+        self._seq = 0
+        self._cv = threading.Condition()
+        self._thread = None
+
+    def track(self, name, poll_fn, eta=None, timeout=600.0):
+        """Registers a job and returns a Future resolving to its result."""
+        job = TrackedJob(name, poll_fn, eta=eta, timeout=timeout)
+        self._schedule(job, self._first_delay(eta))
+        return job.future
+
+    def track_gradio(self, name, job, timeout=600.0):
+        """Tracks a gradio_client Job via its own status/result interface."""
+        def poll():
+            if job.done():
+                return job.result(), 100
+            status = job.status()
+            progress = None
+            data = getattr(status, "progress_data", None)
+            if data:
+                unit = data[-1]
+                if getattr(unit, "length", None):
+                    progress = 100.0 * (unit.index or 0) / unit.length
+            return None, progress
+        eta = getattr(job.status(), "eta", None)
+        return self.track(name, poll, eta=eta, timeout=timeout)
+
+    def _first_delay(self, eta):
+        if not eta:
+            return self.min_interval
+        # Check a little before the advertised ETA; it is usually conservative
+        return min(max(float(eta) * 0.9, self.min_interval), self.max_interval * 4)
+
+    def _next_delay(self, job):
+        if job.progress and 0 < job.progress < 100:
+            # Project remaining time from the observed progress rate and check
+            # halfway there, so we converge on completion without overshooting.
+            remaining = job.elapsed * (100 - job.progress) / job.progress
+            delay = remaining / 2
+        else:
+            delay = (job.interval or self.min_interval) * self.backoff
+        delay = min(max(delay, self.min_interval), self.max_interval)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _schedule(self, job, delay):
+        job.interval = delay
+        with self._cv:
+            self._seq += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._seq, job))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="job-tracker", daemon=True)
+                self._thread.start()
+            self._cv.notify()
+
+    def _loop(self):
+        while True:
+            with self._cv:
+                if not self._heap:
+                    self._thread = None
+                    return
+                due, _, job = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cv.wait(timeout=wait)
+                    continue
+                heapq.heappop(self._heap)
+            try:
+                job.context.run(self._poll, job)
+            except Exception as e:
+                # This is the only thread polling; one bad job must not strand the rest
+                job.settle(error=e)
+
+    def _poll(self, job):
+        if job.future.cancelled():
+            return
+        job.polls += 1
+        try:
+            with span("job.poll", job=job.name, attempt=job.polls) as s:
+                result, progress = job.poll_fn()
+                s.update(progress=progress, done=result is not None)
+        except Exception as e:
+            job.settle(error=e)
+            return
+
+        if result is not None:
+            latency = job.elapsed
+            self.latencies[job.name] = latency
+            print(f"   ✅ {job.name} done in {latency:.1f}s ({job.polls} polls)")
+            job.settle(result)
+            return
+
+        if job.elapsed >= job.timeout:
+            job.settle(error=TimeoutError(f"{job.name} timed out after {job.timeout:.0f}s"))
+            return
+
+        job.progress = progress
+        delay = self._next_delay(job)
+        print(f"   ⏳ {job.name}: progress {progress if progress is not None else 'Unknown'}%, next poll in {delay:.1f}s")
+        self._schedule(job, delay)
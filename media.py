@@ -0,0 +1,65 @@
+import os
+import json
+import subprocess
+from fractions import Fraction
+
+# Named output profiles. size=None keeps the native b-roll canvas, fps=None the
+# highest frame rate among the b-roll and avatar clips; "fit" is how b-roll of
+# another aspect ratio fills the frame ("contain" letterboxes, "cover" crops).
+# maxrate caps the CRF encode.
+PROFILES = {
+    "source": {"size": None, "fps": None, "fit": "contain", "crf": 23, "preset": "medium",
+               "maxrate": None, "audio_bitrate": "128k", "threads": 0},
+    "youtube-1080p": {"size": (1920, 1080), "fps": 30, "fit": "contain", "crf": 20, "preset": "slow",
+                      "maxrate": "12M", "audio_bitrate": "192k", "threads": 0},
+    "shorts-portrait": {"size": (1080, 1920), "fps": 30, "fit": "cover", "crf": 21, "preset": "medium",
+                        "maxrate": "10M", "audio_bitrate": "160k", "threads": 0},
+    "telegram-preview": {"size": (854, 480), "fps": 24, "fit": "contain", "crf": 28, "preset": "veryfast",
+                         "maxrate": "1200k", "audio_bitrate": "96k", "threads": 0},
+}
+
+def get_profile(name=None, **overrides):
+    """Looks up a profile by name (default: TRENDEY_PROFILE or "source"), applying overrides that aren't None."""
+    name = name or (os.getenv("TRENDEY_PROFILE") or "").strip() or "source"
+    if name not in PROFILES:
+        raise ValueError(f"Unknown encode profile: {name} (choose from {', '.join(PROFILES)})")
+    profile = {**PROFILES[name], "name": name}
+    profile.update({k: v for k, v in overrides.items() if v is not None})
+    if not profile["threads"]:
+        # x264's own auto mode counts host cores, oversubscribing CPU-limited containers
+        profile["threads"] = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    return profile
+
+def _rate(value):
+    try:
+        rate = Fraction(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return float(rate) if rate > 0 else None
+
+def probe_info(path, ffprobe="ffprobe"):
+    """Stream details of a media file via ffprobe: size, fps, pix_fmt, audio codec and rate, duration."""
+    out = subprocess.run(
+        [ffprobe, "-v", "error", "-show_entries",
+         "stream=codec_type,codec_name,width,height,avg_frame_rate,r_frame_rate,pix_fmt,sample_rate:format=duration",
+         "-of", "json", path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    info = json.loads(out)
+    streams = info.get("streams", [])
+    video = next((st for st in streams if st.get("codec_type") == "video"), {})
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), {})
+    return {
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "fps": _rate(video.get("avg_frame_rate")) or _rate(video.get("r_frame_rate")),
+        "pix_fmt": video.get("pix_fmt"),
+        "audio_codec": audio.get("codec_name"),
+        "audio_rate": int(audio["sample_rate"]) if audio.get("sample_rate") else None,
+        "duration": float(info["format"]["duration"]),
+    }
+
+def probe(path, ffprobe="ffprobe"):
+    """Returns (width, height, duration) of a media file via ffprobe. Width/height are None for audio."""
+    info = probe_info(path, ffprobe)
+    return info["width"], info["height"], info["duration"]
@@ -0,0 +1,115 @@
+import gc
+import os
+import threading
+from collections import OrderedDict
+
+# Local text-to-video checkpoints served by app.py, keyed by the UI's model choice.
+# Frame counts must be frame_step * k + 1 and sides multiples of size_step.
+MODELS = {
+    "wan-2.1-1.3b": {"repo": "Wan-AI/Wan2.1-T2V-1.3B-Diffusers", "pipeline": "WanPipeline", "fps": 16,
+                     "frame_step": 4, "size_step": 16},
+    "wan-2.1-14b": {"repo": "Wan-AI/Wan2.1-T2V-14B-Diffusers", "pipeline": "WanPipeline", "fps": 16,
+                    "frame_step": 4, "size_step": 16},
+    "ltx-video": {"repo": "Lightricks/LTX-Video", "pipeline": "LTXPipeline", "fps": 24,
+                  "frame_step": 8, "size_step": 32},
+}
+
+def resolve_model(choice):
+    """Normalizes a UI label like "wan-2.1-14b (ZeroGPU Required)" to a MODELS key."""
+    key = str(choice or "").split(" (")[0].strip().lower()
+    if key not in MODELS:
+        raise ValueError(f"Unknown model: {choice}")
+    return key
+
+def _release_cuda():
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+class ModelCache:
+    """Bounded LRU of loaded pipelines.
+
+    Only the most recently used pipeline sits on the accelerator; the others
+    are offloaded to CPU RAM (when `offload` is on) so switching back costs a
+    device copy instead of a full reload from disk. Past `capacity` the least
+    recently used pipeline is dropped entirely.
+    """
+
+    def __init__(self, capacity=2, offload=True, device=None):
+        self.capacity = max(1, capacity)
+        self.offload = offload
+        self.device = device
+        self._entries = OrderedDict()
+        self._active = None
+        self._lock = threading.RLock()
+
+    def _device(self):
+        if self.device is None:
+            import torch
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        return self.device
+
+    def get(self, key, loader):
+        """Returns the pipeline for `key` on the accelerator, loading it with `loader()` on a miss."""
+        with self._lock:
+            device = self._device()
+            pipe = self._entries.get(key)
+            if pipe is None:
+                # Make room before loading so two large models never overlap in memory
+                while len(self._entries) >= self.capacity:
+                    self._evict()
+                self._park_active(device)
+                print(f"   📦 Loading {key}...")
+                pipe = loader()
+                self._entries[key] = pipe
+            else:
+                self._entries.move_to_end(key)
+                if self._active != key:
+                    self._park_active(device)
+                    print(f"   ♻️ Reusing {key}")
+            if self._active != key:
+                pipe.to(device)
+                self._active = key
+            return pipe
+
+    def _park_active(self, device):
+        if self._active is None or self._active not in self._entries:
+            self._active = None
+            return
+        if not self.offload:
+            # Without offload, only one pipeline is kept around at all
+            del self._entries[self._active]
+        elif device != "cpu":
+            self._entries[self._active].to("cpu")
+            print(f"   💤 Offloaded {self._active} to CPU")
+        # On a CPU device the pipeline already sits in host memory and simply stops being active
+        self._active = None
+        _release_cuda()
+
+    def _evict(self):
+        key, _ = self._entries.popitem(last=False)
+        if key == self._active:
+            self._active = None
+        print(f"   🗑️ Evicted {key}")
+        _release_cuda()
+
+    def loaded(self):
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._active = None
+            _release_cuda()
+
+    @classmethod
+    def from_env(cls):
+        """Builds the cache from TRENDEY_MODEL_CACHE (pipelines kept) / TRENDEY_MODEL_OFFLOAD."""
+        capacity = int(os.getenv("TRENDEY_MODEL_CACHE") or 2)
+        offload = (os.getenv("TRENDEY_MODEL_OFFLOAD") or "1").strip().lower() not in ("0", "false", "no", "off")
+        return cls(capacity, offload=offload)
@@ -1,13 +1,22 @@
 import os
 import time
 import json
-from engine import ScriptEngine, RemoteAssetEngine, AudioEngine
-from assembler import VideoAssembler
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from media import probe
+from pipeline import StageGraph, RunManifest
+from cache import AssetCache, PromptCache
+from tracing import tracer, propagate
+from segments import plan_avatar_segments, cut_audio, segment_path
+
+# engine, assembler and delivery (and the client libraries behind them) are
+# imported when their component is first used, so a misconfigured or dry run
+# exits before paying for them.
 
 class TrendeyOrchestrator:
     """The Main Agent that runs the entire pipeline from Topic to MP4."""
     
-    def __init__(self):
+    def __init__(self, script_engine=None, asset_engine=None, audio_engine=None, assembler=None):
         # Configuration - Load from Environment or Config
         from dotenv import load_dotenv
         load_dotenv()
@@ -16,6 +25,21 @@ class TrendeyOrchestrator:
         self.video_space = (os.getenv("VIDEO_BACKEND") or "").strip() or "Wan-AI/Wan2.1"
         self.lipsync_space = (os.getenv("AVATAR_BACKEND") or "").strip() or "KwaiVGI/LivePortrait"
         self.avatar_ref = "assets/avatar_ref.jpg"
+        # Cap on concurrently running pipeline stages
+        self.max_workers = int(os.getenv("TRENDEY_MAX_WORKERS") or 3)
+        # Cap on b-roll jobs in flight on the video Space
+        self.max_video_jobs = int(os.getenv("TRENDEY_BROLL_JOBS") or 3)
+        # Seconds before a slow job is duplicated on another backend (unset = adaptive, 0 = off)
+        hedge_after = (os.getenv("TRENDEY_HEDGE_AFTER") or "").strip()
+        self.hedge_after = float(hedge_after) if hedge_after else None
+        # Avatar lip-sync is split into segments of at most this many seconds, rendered in parallel
+        self.avatar_segment_max = float(os.getenv("TRENDEY_AVATAR_SEGMENT_MAX") or 20)
+        self.max_avatar_jobs = int(os.getenv("TRENDEY_AVATAR_JOBS") or 3)
+        self.ffmpeg = (os.getenv("FFMPEG_BINARY") or "").strip() or "ffmpeg"
+        # Topics produced concurrently in batch mode
+        self.batch_topics = int(os.getenv("TRENDEY_BATCH_TOPICS") or 2)
+        # "ffmpeg" renders in a single filtergraph; "moviepy" is the original path
+        self.assembler_name = (os.getenv("TRENDEY_ASSEMBLER") or "").strip().lower() or "moviepy"
         
         # Hardcoded High-CPM Topics for 2026
         self.default_topics = [
@@ -25,96 +49,296 @@ class TrendeyOrchestrator:
             "Future of Work: The 3-Day Week is Here",
         ]
         
-        # Initialize Engines
-        self.script_engine = ScriptEngine(self.hf_token)
-        self.asset_engine = RemoteAssetEngine(self.video_space, self.lipsync_space, hf_token=self.hf_token)
-        self.audio_engine = AudioEngine()
-        self.assembler = VideoAssembler()
+        # Engines are built on first use (any of them can be passed in, e.g.
+        # local stand-ins for benchmarking)
+        self._components = {name: value for name, value in [
+            ("script_engine", script_engine), ("asset_engine", asset_engine),
+            ("audio_engine", audio_engine), ("assembler", assembler)] if value}
+        self._components_lock = threading.RLock()
+        # Stage graph of every run by run ID
+        self.graphs = {}
+
+    def _component(self, name, build):
+        # Batch runs touch these from several threads; each is built exactly once
+        with self._components_lock:
+            if name not in self._components:
+                self._components[name] = build()
+            return self._components[name]
+
+    @property
+    def cache(self):
+        return self._component("cache", AssetCache.from_env)
+
+    @property
+    def script_engine(self):
+        def build():
+            from engine import AsyncScriptEngine
+            return AsyncScriptEngine(self.hf_token, prompt_cache=PromptCache.from_env())
+        return self._component("script_engine", build)
+
+    @property
+    def asset_engine(self):
+        def build():
+            from engine import RemoteAssetEngine
+            return RemoteAssetEngine(self.video_space, self.lipsync_space, hf_token=self.hf_token,
+                                     max_video_jobs=self.max_video_jobs, cache=self.cache,
+                                     hedge_after=self.hedge_after)
+        return self._component("asset_engine", build)
+
+    @property
+    def audio_engine(self):
+        def build():
+            from engine import AudioEngine
+            # Chunked TTS synthesizes sentences concurrently and writes word/sentence timings
+            tts_chunked = (os.getenv("TRENDEY_TTS_CHUNKED") or "1").strip().lower() not in ("0", "false", "off")
+            return AudioEngine(cache=self.cache, chunked=tts_chunked)
+        return self._component("audio_engine", build)
+
+    @property
+    def assembler(self):
+        def build():
+            from assembler import VideoAssembler, FFmpegAssembler
+            return FFmpegAssembler.from_env() if self.assembler_name == "ffmpeg" else VideoAssembler()
+        return self._component("assembler", build)
+
+    @property
+    def delivery(self):
+        """Telegram delivery, or None without credentials."""
+        def build():
+            from delivery import TelegramDelivery
+            return TelegramDelivery.from_env()
+        return self._component("delivery", build)
+
+    @delivery.setter
+    def delivery(self, value):
+        with self._components_lock:
+            self._components["delivery"] = value
+
+    def check(self):
+        """Cheap configuration checks, run before anything is imported or connected. Prints and returns the problems found."""
+        problems = []
+        if not self.hf_token:
+            problems.append("HF_TOKEN is missing! Please add it to your environment or GitHub Secrets.")
+        if not os.path.exists(self.avatar_ref):
+            problems.append(f"Avatar reference photo not found at {self.avatar_ref}")
+        for problem in problems:
+            print(f"❌ Error: {problem}")
+        return problems
 
-    def run(self, manual_topic=None):
+    def run(self, manual_topic=None, resume=None):
         print("🚀 Starting Trendey Pipeline...")
         
         # Validation
-        if not self.hf_token:
-            print("❌ Error: HF_TOKEN is missing! Please add it to your environment or GitHub Secrets.")
-            return None
-            
-        # Check for avatar image
-        if not os.path.exists(self.avatar_ref):
-            print(f"❌ Error: Avatar reference photo not found at {self.avatar_ref}")
+        if self.check():
             return None
 
-        # Step 1: Topic Selection (Hardcoded as requested)
-        topic = "India AI Summit 2026"
-        # if manual_topic:
-        #     topic = manual_topic
-        # else:
-        #     # Brainstorm and ask via Telegram
-        #     print("🧠 Brainstorming topics...")
-        #     topics = [self.script_engine.get_viral_topic() for _ in range(3)]
-        #     from telegram_bot import TelegramInterface
-        #     tg = TelegramInterface()
-        #     tg.send_topic_options(topics)
-        #     # For simplicity in GitHub Actions, if no topic is provided, choose the first one
-        #     topic = topics[0]
-            
+        # Resuming reloads the journaled topic and skips completed stages
+        if resume:
+            try:
+                manifest = RunManifest.load(resume)
+            except FileNotFoundError as e:
+                print(f"❌ Error: {e}")
+                return None
+            topic = manifest["topic"]
+            print(f"♻️ Resuming run {manifest.run_id}")
+        else:
+            # Step 1: Topic Selection (Hardcoded unless one is passed in)
+            topic = manual_topic or "India AI Summit 2026"
+            # if manual_topic:
+            #     topic = manual_topic
+            # else:
+            #     # Brainstorm and ask via Telegram
+            #     print("🧠 Brainstorming topics...")
+            #     topics = self.script_engine.get_viral_topics(3)
+            #     from telegram_bot import TelegramInterface
+            #     tg = TelegramInterface()
+            #     tg.send_topic_options(topics)
+            #     # For simplicity in GitHub Actions, if no topic is provided, choose the first one
+            #     topic = topics[0]
+            manifest = RunManifest.create()
+            manifest["topic"] = topic
+            print(f"🆔 Run ID: {manifest.run_id} (resume with --resume {manifest.run_id})")
+
         print(f"📌 Producing: {topic}")
-        
+        audio_path = manifest.file("voiceover.mp3")
+        avatar_video_path = manifest.file("avatar_talking.mp4")
+
+        # Steps 2-6 run as a dependency graph: b-roll only needs the script,
+        # the avatar only needs the voiceover, so they overlap.
+        graph = StageGraph(max_workers=self.max_workers, manifest=manifest)
+
         # Step 2: Scripting
-        script = self.script_engine.generate_full_script(topic)
-        print(f"📖 Script Generated: {script['title']}")
-        
+        def scripting():
+            script = self.script_engine.generate_full_script(topic)
+            print(f"📖 Script Generated: {script['title']}")
+            return script
+        graph.add("script", scripting)
+
         # Step 3: Voiceover
-        audio_path = "temp/voiceover.mp3"
-        os.makedirs("temp", exist_ok=True)
-        self.audio_engine.generate(script['voiceover_text'], audio_path)
-        
-        # Step 4: B-Roll Generation (First prompt only for MVP)
-        b_roll_path = "temp/broll_1.mp4"
-        self.asset_engine.generate_video_clip(script['b_roll_prompts'][0], b_roll_path)
-        
+        graph.add("voiceover", lambda script: self.audio_engine.generate(script['voiceover_text'], audio_path), deps=["script"])
+
+        # Step 4: B-Roll Generation (all prompts in parallel)
+        def b_roll(script):
+            prompts = [p for p in script.get('b_roll_prompts') or [] if str(p).strip()]
+            if not prompts:
+                # Same stand-in _parse_script uses when the LLM reply has no usable script
+                print("⚠️ Script has no b-roll prompts, using the topic as the prompt")
+                prompts = [f"{topic} cinematic visual"]
+            paths = [manifest.file(f"broll_{i + 1}.mp4") for i in range(len(prompts))]
+            return self.asset_engine.generate_video_clips(prompts, paths)
+        graph.add("broll", b_roll, deps=["script"])
+
         # Step 5: Talking Avatar
-        avatar_video_path = "temp/avatar_talking.mp4"
-        self.asset_engine.generate_talking_avatar(self.avatar_ref, audio_path, avatar_video_path)
-        
+        graph.add("avatar", lambda script, audio: self.render_avatar_segments(script, audio, avatar_video_path), deps=["script", "voiceover"])
+
         # Step 6: Assemble
-        final_video = self.assembler.assemble(
-            [b_roll_path], 
-            avatar_video_path, 
-            audio_path, 
-            script
-        )
+        graph.add("assemble", lambda script, audio, broll, avatar: self.assembler.assemble(
+            broll,
+            avatar,
+            audio,
+            script,
+            final_name=f"final_{manifest.run_id}.mp4"
+        ), deps=["script", "voiceover", "broll", "avatar"])
+
+        # Batch topics run concurrently, so each run's graph is kept under its ID
+        self.graphs[manifest.run_id] = graph
+        self.last_graph = graph
+        trace_mark = tracer.mark()
+        try:
+            # Spans are tagged with the run ID so concurrent topics don't share a trace
+            with tracer.run(manifest.run_id):
+                results = graph.run()
+        finally:
+            graph.report()
+            # Chrome trace (chrome://tracing / Perfetto) plus a summary table
+            trace_path = tracer.export(manifest.file("trace.json"), since=trace_mark, run=manifest.run_id)
+            tracer.print_summary(since=trace_mark, run=manifest.run_id)
+            print(f"🧭 Trace written to {trace_path}")
+        script = results["script"]
+        final_video = results["assemble"]
         
         # Step 7: Notify via Telegram
-        self.notify(final_video, f"🎬 *Trendey Success!*\n\n*Topic:* {topic}\n*Title:* {script.get('title', 'Video Generated')}")
+        if not manifest["notified"]:
+            # Left unset on failure so --resume retries (and finishes a split upload)
+            manifest["notified"] = bool(self.notify(
+                final_video, f"🎬 *Trendey Success!*\n\n*Topic:* {topic}\n*Title:* {script.get('title', 'Video Generated')}",
+                manifest))
         
         print(f"🏆 MISSION COMPLETE: {final_video}")
         return final_video
 
-    def notify(self, file_path, caption):
-        bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
-        chat_id = os.getenv("TELEGRAM_CHAT_ID")
-        
-        if not bot_token or not chat_id:
+    def render_avatar_segments(self, script, audio_path, output_path):
+        """Lip-syncs only the stretches of the voiceover that show the avatar, in parallel.
+
+        The audio is split at avatar_schedule boundaries (and long stretches at
+        sentence ends). Returns the rendered segments as dicts with `path`,
+        `start`, `end` and `position`, ready for the assembler.
+        """
+        from engine import AudioEngine
+        timings = AudioEngine.load_timings(audio_path)
+        duration = timings["duration"] if timings else probe(audio_path)[2]
+        segments = plan_avatar_segments(script.get("avatar_schedule"), duration, timings, self.avatar_segment_max)
+        visible = [seg for seg in segments if seg["visible"]]
+        print(f"👤 Avatar: {len(visible)}/{len(segments)} segments visible")
+
+        # A single segment covering the whole voiceover needs no cutting
+        if len(visible) == 1 and visible[0]["start"] == 0 and visible[0]["end"] >= duration:
+            self.asset_engine.generate_talking_avatar(self.avatar_ref, audio_path, output_path)
+            return [{**visible[0], "path": output_path}]
+
+        def render(i, segment):
+            clip_audio = cut_audio(audio_path, segment["start"], segment["end"],
+                                   segment_path(output_path, i, ".wav"), ffmpeg=self.ffmpeg)
+            path = self.asset_engine.generate_talking_avatar(self.avatar_ref, clip_audio, segment_path(output_path, i, ".mp4"))
+            return {**segment, "path": path}
+
+        with ThreadPoolExecutor(max_workers=self.max_avatar_jobs) as pool:
+            return list(pool.map(propagate(render), range(len(visible)), visible))
+
+    def run_batch(self, topics=None):
+        """Produces several topics in one process, sharing engines and Space clients.
+
+        Up to `batch_topics` runs overlap, so one topic's script and voiceover
+        proceed while another's b-roll renders. The video Space concurrency cap
+        is enforced by RemoteAssetEngine across all topics.
+        """
+        if self.check():
+            return {}
+
+        topics = list(topics or self.default_topics)
+        print(f"📦 Batch mode: {len(topics)} topics, {self.batch_topics} in flight")
+        t0 = time.perf_counter()
+        results = {}
+
+        # Fetch every script concurrently up front; each run's script stage
+        # then hits the prompt cache instead of waiting on the LLM in turn.
+        if getattr(self.script_engine, "prompt_cache", None) and hasattr(self.script_engine, "generate_scripts"):
+            print("🧠 Prefetching scripts...")
+            self.script_engine.generate_scripts(topics)
+
+        def produce(topic):
+            try:
+                return self.run(manual_topic=topic)
+            except Exception as e:
+                print(f"❌ Topic failed: {topic}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.batch_topics) as pool:
+            futures = {pool.submit(produce, topic): topic for topic in topics}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+
+        wall = time.perf_counter() - t0
+        produced = sum(1 for path in results.values() if path)
+        print(f"📦 Batch complete: {produced}/{len(topics)} videos in {wall / 60:.1f} min "
+              f"({produced / wall * 3600:.2f} videos/hour)")
+        for topic in topics:
+            print(f"   {'✅' if results.get(topic) else '❌'} {topic}: {results.get(topic)}")
+        return results
+
+    def notify(self, file_path, caption, manifest=None):
+        """Sends the final video to Telegram. Returns True once delivered.
+
+        Progress of a split delivery is journaled in `manifest`, so a resumed
+        run only sends the remaining parts.
+        """
+        if not self.delivery:
             print("⚠️ Telegram credentials missing. Skipping notification.")
             return
 
         print("📲 Sending video to Telegram...")
-        url = f"https://api.telegram.org/bot{bot_token}/sendVideo"
+        state = (manifest["delivery"] if manifest is not None else None) or {}
+        checkpoint = (lambda st: manifest.__setitem__("delivery", st)) if manifest is not None else None
         try:
-            with open(file_path, "rb") as video:
-                response = requests.post(url, data={
-                    "chat_id": chat_id,
-                    "caption": caption,
-                    "parse_mode": "Markdown"
-                }, files={"video": video})
-                if response.status_code == 200:
-                    print("✅ Telegram notification sent!")
-                else:
-                    print(f"❌ Telegram Error: {response.text}")
+            method = self.delivery.deliver(file_path, caption, state=state, checkpoint=checkpoint)
+            print(f"✅ Telegram notification sent! ({method})")
+            return True
         except Exception as e:
             print(f"❌ Failed to send Telegram: {e}")
+            return False
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the Trendey pipeline.")
+    parser.add_argument("topic", nargs="*", help="Manual topic (optional)")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Resume a previous run, skipping completed stages")
+    parser.add_argument("--batch", nargs="*", metavar="TOPIC",
+                        help="Produce several topics in one run (defaults to the built-in topic list)")
+    parser.add_argument("--topics-file", help="Batch topics, one per line")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Check the configuration and exit without loading engines or contacting Spaces")
+    args = parser.parse_args()
+
     agent = TrendeyOrchestrator()
-    agent.run()
+    if args.dry_run:
+        problems = agent.check()
+        print(f"🧪 Dry run: video={agent.video_space} avatar={agent.lipsync_space} assembler={agent.assembler_name}")
+        raise SystemExit(1 if problems else 0)
+    if args.batch is not None or args.topics_file:
+        topics = list(args.batch or [])
+        if args.topics_file:
+            with open(args.topics_file) as f:
+                topics += [line.strip() for line in f if line.strip()]
+        agent.run_batch(topics)
+    else:
+        agent.run(manual_topic=" ".join(args.topic) or None, resume=args.resume)
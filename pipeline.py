@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from tracing import span, propagate
+
+def _usage():
+    """(process CPU, reaped subprocess CPU, peak RSS in MB or None) so far."""
+    t = os.times()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+    return t.user + t.system, t.children_user + t.children_system, rss
+
+class StageGraph:
+    """Runs pipeline stages as soon as their dependencies have finished."""
+
+    def __init__(self, max_workers=3, manifest=None):
+        self.max_workers = max_workers
+        self.manifest = manifest
+        self.stages = {}
+        self.results = {}
+        self.timings = {}
+
+    def add(self, name, fn, deps=()):
+        """Registers a stage. `fn` is called with the results of `deps`, in order."""
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' is already registered")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self.stages[name] = (fn, tuple(deps))
+        return self
+
+    def _timed(self, name, fn, args):
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        usage_start = _usage()
+        try:
+            with span(f"stage.{name}"):
+                return fn(*args)
+        finally:
+            end = time.perf_counter()
+            process_cpu, children_cpu, rss = _usage()
+            # `cpu` is the stage's own thread only. Process and subprocess CPU
+            # (ffmpeg, once reaped) and the RSS high-water mark are process-wide
+            # deltas, so stages running concurrently are counted in each other's.
+            self.timings[name] = {"start": start, "end": end, "duration": end - start,
+                                  "cpu": time.thread_time() - cpu_start,
+                                  "process_cpu": process_cpu - usage_start[0],
+                                  "children_cpu": children_cpu - usage_start[1],
+                                  "peak_rss_mb": rss,
+                                  "rss_growth_mb": rss - usage_start[2] if rss is not None else None}
+
+    def run(self):
+        """Executes the graph and returns a dict of stage name -> result."""
+        pending = dict(self.stages)
+        running = {}
+        t0 = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                # Submit every stage whose inputs are ready. Skipping a completed
+                # stage can unblock others, so repeat until nothing changes.
+                progressed = True
+                while progressed:
+                    progressed = False
+                    for name, (fn, deps) in list(pending.items()):
+                        if not all(d in self.results for d in deps):
+                            continue
+                        del pending[name]
+                        progressed = True
+                        if self.manifest and self.manifest.completed(name):
+                            self.results[name] = self.manifest.output(name)
+                            print(f"   ⏭️ Stage skipped (already completed): {name}")
+                            continue
+                        args = [self.results[d] for d in deps]
+                        if self.manifest:
+                            self.manifest.start(name, args)
+                        print(f"   ▶️ Stage started: {name}")
+                        running[pool.submit(propagate(self._timed), name, fn, args)] = name
+
+                if not running and not pending:
+                    break
+
+                if not running:
+                    raise RuntimeError(f"Unresolvable stages: {sorted(pending)}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = self._settle(name, future)
+                    if error is not None:
+                        self._drain(running, name)
+                        self.wall_time = time.perf_counter() - t0
+                        raise error
+
+        self.wall_time = time.perf_counter() - t0
+        return self.results
+
+    def _settle(self, name, future):
+        """Records a finished stage in the results and manifest. Returns its error, if any."""
+        error = future.exception()
+        if error is not None:
+            if self.manifest:
+                self.manifest.fail(name, error)
+            print(f"❌ Stage '{name}' failed: {error}")
+            return error
+        self.results[name] = future.result()
+        if self.manifest:
+            self.manifest.finish(name, self.results[name], self.timings[name]["duration"])
+        print(f"   ✅ Stage finished: {name} ({self.timings[name]['duration']:.1f}s)")
+        return None
+
+    def _drain(self, running, failed):
+        """After `failed` fails: cancels stages not yet started and journals the ones already running.
+
+        Running stages can't be interrupted, so their results are kept and
+        `--resume` doesn't redo them.
+        """
+        for future, name in running.items():
+            if future.cancel():
+                if self.manifest:
+                    self.manifest.fail(name, f"cancelled after '{failed}' failed")
+        running = {f: n for f, n in running.items() if not f.cancelled()}
+        if running:
+            print(f"   ⏳ Waiting for running stages to finish: {', '.join(sorted(running.values()))}")
+        for future in wait(running).done:
+            self._settle(running[future], future)
+
+    def report(self):
+        """Prints per-stage timings against total wall-clock time."""
+        print("⏱️ Stage timings:")
+        for name, t in sorted(self.timings.items(), key=lambda kv: kv[1]["start"]):
+            print(f"   {name:<12} {t['duration']:>8.1f}s")
+        serial = sum(t["duration"] for t in self.timings.values())
+        print(f"   {'wall':<12} {getattr(self, 'wall_time', 0.0):>8.1f}s (serial sum {serial:.1f}s)")
+
+class RunManifest:
+    """JSON journal of a pipeline run: each stage's inputs, output and status."""
+
+    def __init__(self, run_id, root="temp"):
+        self.run_id = run_id
+        self.dir = os.path.join(root, run_id)
+        self.path = os.path.join(self.dir, "manifest.json")
+        self.data = {"run_id": run_id, "created": time.time(), "stages": {}}
+
+    @classmethod
+    def create(cls, root="temp"):
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        manifest = cls(run_id, root)
+        os.makedirs(manifest.dir, exist_ok=True)
+        manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, run_id, root="temp"):
+        manifest = cls(run_id, root)
+        if not os.path.exists(manifest.path):
+            raise FileNotFoundError(f"No manifest for run '{run_id}' at {manifest.path}")
+        with open(manifest.path) as f:
+            manifest.data = json.load(f)
+        return manifest
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.data, f, indent=2, default=str)
+        os.replace(tmp, self.path)
+
+    def __getitem__(self, key):
+        return self.data.get(key)
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.save()
+
+    def file(self, name):
+        """Path for a stage artifact inside this run's directory."""
+        return os.path.join(self.dir, name)
+
+    def completed(self, name):
+        """True if the stage finished and every file it produced is still on disk."""
+        stage = self.data["stages"].get(name)
+        if not stage or stage.get("status") != "completed":
+            return False
+        output = stage.get("output")
+        items = output if isinstance(output, list) else [output]
+        # Outputs are paths, lists of paths, or dicts carrying a "path"
+        paths = [i.get("path") if isinstance(i, dict) else i for i in items]
+        return all(os.path.exists(p) for p in paths if isinstance(p, str))
+
+    def output(self, name):
+        return self.data["stages"][name]["output"]
+
+    def start(self, name, inputs):
+        self.data["stages"][name] = {"status": "running", "inputs": inputs, "started": time.time()}
+        self.save()
+
+    def finish(self, name, output, duration):
+        stage = self.data["stages"].setdefault(name, {})
+        stage.update({"status": "completed", "output": output, "duration": duration, "finished": time.time()})
+        self.save()
+
+    def fail(self, name, error):
+        stage = self.data["stages"].setdefault(name, {})
+        stage.update({"status": "failed", "error": str(error), "finished": time.time()})
+        self.save()
@@ -0,0 +1,97 @@
+import os
+import subprocess
+
+# avatar_schedule positions that mean the avatar is off screen
+HIDDEN_POSITIONS = {"hidden", "none", "off", "broll"}
+
+def _cue_time(value):
+    """Seconds of an avatar_schedule cue time: a number, "12.5", "12s" or "0:12". None if unreadable."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        t = float(value)
+    elif isinstance(value, str):
+        text = value.strip().lower().rstrip("s").strip()
+        try:
+            t = 0.0
+            for part in text.split(":"):
+                t = t * 60 + float(part)
+        except ValueError:
+            return None
+    else:
+        return None
+    return t if t == t and 0 <= t < float("inf") else None
+
+def schedule_spans(schedule, duration):
+    """Turns avatar_schedule cue points into contiguous (start, end, position, action) spans.
+
+    The schedule comes straight from the LLM: cues whose time can't be read are skipped.
+    """
+    cues = []
+    for c in schedule if isinstance(schedule, (list, tuple)) else []:
+        if not isinstance(c, dict):
+            continue
+        t = _cue_time(c.get("time", 0))
+        if t is not None and t < duration:
+            cues.append({**c, "time": t})
+    cues.sort(key=lambda c: c["time"])
+    if not cues or cues[0]["time"] > 0:
+        # Before the first cue the avatar is shown as it always was
+        cues.insert(0, {"time": 0.0, "position": "corner", "action": "talk"})
+
+    spans = []
+    for i, cue in enumerate(cues):
+        start = cue["time"]
+        end = cues[i + 1]["time"] if i + 1 < len(cues) else duration
+        if end > start:
+            spans.append({"start": start, "end": end,
+                          "position": str(cue.get("position", "corner")).lower(),
+                          "action": cue.get("action")})
+    return spans
+
+def _split_long(span, cut_points, max_segment):
+    """Splits a span at the given cut points (sentence ends) so no piece exceeds max_segment."""
+    pieces = []
+    start, end = span["start"], span["end"]
+    inner = sorted(t for t in cut_points if start < t < end)
+    while end - start > max_segment:
+        # Latest cut point that keeps this piece within budget, else the earliest one past it
+        fitting = [t for t in inner if t - start <= max_segment]
+        cut = fitting[-1] if fitting else next((t for t in inner if t > start), None)
+        if cut is None:
+            break
+        pieces.append({**span, "start": start, "end": cut})
+        inner = [t for t in inner if t > cut]
+        start = cut
+    pieces.append({**span, "start": start, "end": end})
+    return pieces
+
+def plan_avatar_segments(schedule, duration, timings=None, max_segment=20.0):
+    """Plans which stretches of the voiceover need a lip-synced avatar.
+
+    Segments follow avatar_schedule boundaries; long ones are split further at
+    sentence ends (natural pauses, from the TTS timings) so they can be
+    rendered in parallel. Spans whose position is hidden are returned with
+    `visible=False` and need no rendering.
+    """
+    cut_points = [s["end"] for s in (timings or {}).get("sentences", [])]
+    segments = []
+    for span in schedule_spans(schedule, duration):
+        visible = span["position"] not in HIDDEN_POSITIONS
+        pieces = _split_long(span, cut_points, max_segment) if visible and max_segment else [span]
+        for piece in pieces:
+            segments.append({**piece, "visible": visible})
+    return segments
+
+def cut_audio(audio_path, start, end, output_path, ffmpeg="ffmpeg"):
+    """Cuts [start, end) of the voiceover to a sample-accurate PCM WAV."""
+    subprocess.run(
+        [ffmpeg, "-y", "-v", "error", "-i", audio_path, "-ss", f"{start:.3f}", "-to", f"{end:.3f}",
+         "-c:a", "pcm_s16le", output_path],
+        check=True
+    )
+    return output_path
+
+def segment_path(base, index, ext):
+    root, _ = os.path.splitext(base)
+    return f"{root}_{index:02d}{ext}"
@@ -1,7 +1,8 @@
 import os
-import requests
 from dotenv import load_dotenv
 
+from delivery import TelegramDelivery, session
+
 load_dotenv()
 
 class TelegramInterface:
@@ -10,17 +11,21 @@ class TelegramInterface:
         self.chat_id = os.getenv("TELEGRAM_CHAT_ID")
         self.github_token = os.getenv("GH_PAT")  # GitHub Personal Access Token
         self.repo = os.getenv("GH_REPO")         # e.g. "username/Trendey"
+        # Shares the pooled session, retries and upload fallbacks with the orchestrator
+        self.delivery = TelegramDelivery.from_env()
 
     def send_message(self, text, reply_markup=None):
-        url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-        payload = {
-            "chat_id": self.chat_id,
-            "text": text,
-            "parse_mode": "Markdown"
-        }
-        if reply_markup:
-            payload["reply_markup"] = reply_markup
-        return requests.post(url, json=payload).json()
+        if not self.delivery:
+            print("⚠️ Telegram credentials missing. Skipping message.")
+            return None
+        return self.delivery.send_message(text, reply_markup)
+
+    def send_video(self, file_path, caption):
+        """Uploads a video, re-encoding, splitting or linking it if it's over Telegram's limit."""
+        if not self.delivery:
+            print("⚠️ Telegram credentials missing. Skipping video.")
+            return None
+        return self.delivery.deliver(file_path, caption)
 
     def send_topic_options(self, topics):
         keyboard = {
@@ -41,7 +46,7 @@ class TelegramInterface:
             "ref": "main",
             "inputs": {"topic": topic}
         }
-        response = requests.post(url, headers=headers, json=payload)
+        response = session().post(url, headers=headers, json=payload, timeout=30)
         if response.status_code == 204:
             self.send_message(f"🚀 *Mission Acknowledged!*\n\nGenerating video for: `{topic}`\nI will send the result here once complete.")
         else:
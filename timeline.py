@@ -0,0 +1,115 @@
+import bisect
+from collections import namedtuple
+
+from segments import schedule_spans, HIDDEN_POSITIONS
+
+# One entry of the edit decision list: show `source` from `offset` during [start, end),
+# drawn into `box` = (x, y, w, h) on the output canvas.
+Cut = namedtuple("Cut", "start end source offset box position")
+
+# Avatar placement per avatar_schedule position, in pixels at 720p (scaled with the canvas)
+LAYOUTS = {
+    "corner": {"height": 300, "align": ("right", "bottom"), "margin": 50},
+    "center": {"height_frac": 0.75, "align": ("center", "center"), "margin": 0},
+}
+
+def layout_box(position, canvas_w, canvas_h, src_w, src_h):
+    """Pixel box (x, y, w, h) for an avatar of size src_w x src_h at `position`."""
+    layout = LAYOUTS.get(position, LAYOUTS["corner"])
+    unit = min(canvas_w, canvas_h) / 720
+    h = int(layout["height"] * unit) if "height" in layout else int(canvas_h * layout["height_frac"])
+    h = min(h, canvas_h)
+    # Portrait canvases: keep the avatar within the frame width too
+    h = min(h, int(canvas_w * 0.9 * src_h / src_w))
+    # Even dimensions keep yuv420p encoders happy
+    w = int(round(src_w * h / src_h / 2)) * 2
+    h = int(h) // 2 * 2
+    ax, ay = layout["align"]
+    m = int(layout["margin"] * unit)
+    x = {"left": m, "center": (canvas_w - w) // 2, "right": canvas_w - w - m}[ax]
+    y = {"top": m, "center": (canvas_h - h) // 2, "bottom": canvas_h - h - m}[ay]
+    return (x, y, w, h)
+
+class Timeline:
+    """Static edit decision list for one video, with O(log n) lookup per frame."""
+
+    def __init__(self, width, height, fps, duration, background, avatar, boxes=None):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.duration = duration
+        self.background = background
+        self.avatar = avatar
+        # Canvas box of each b-roll source, by source index
+        self.boxes = boxes or []
+        self._bg_starts = [c.start for c in background]
+        self._av_starts = [c.start for c in avatar]
+
+    @staticmethod
+    def _find(cuts, starts, t):
+        i = bisect.bisect_right(starts, t) - 1
+        if i >= 0 and t < cuts[i].end:
+            return cuts[i]
+        return None
+
+    def at(self, t):
+        """(background cut, avatar cut or None) active at time t."""
+        return self._find(self.background, self._bg_starts, t), self._find(self.avatar, self._av_starts, t)
+
+def fit_box(src_w, src_h, canvas_w, canvas_h, fit="contain"):
+    """Box (x, y, w, h) that scales a source onto the canvas, letterboxed ("contain") or cropped ("cover")."""
+    scale = (max if fit == "cover" else min)(canvas_w / src_w, canvas_h / src_h)
+    w, h = int(round(src_w * scale / 2)) * 2, int(round(src_h * scale / 2)) * 2
+    # Snap near-misses from rounding to the canvas so they need no pad or crop
+    if abs(w - canvas_w) <= 2:
+        w = canvas_w
+    if abs(h - canvas_h) <= 2:
+        h = canvas_h
+    return ((canvas_w - w) // 2, (canvas_h - h) // 2, w, h)
+
+def compile_timeline(b_roll, avatars, schedule, duration, fps=24, size=None, fit="contain"):
+    """Compiles b-roll cuts and avatar_schedule into a Timeline.
+
+    `b_roll` is a list of (width, height, duration) per clip; `avatars` a list of
+    dicts with `start`, `width`, `height` and `duration` per rendered avatar
+    segment. B-roll is sequenced (looping) to cover `duration`. Without a
+    `size` the canvas is the largest b-roll frame and clips are centered at
+    native size; with one, clips are scaled to it per `fit`. Avatar segments
+    are cut at schedule boundaries so each cut has a single position.
+    """
+    if size:
+        width, height = size
+    else:
+        width = max(w for w, _, _ in b_roll)
+        height = max(h for _, h, _ in b_roll)
+
+    # Where each b-roll clip lands on the canvas
+    boxes = [fit_box(w, h, width, height, fit) if size else ((width - w) // 2, (height - h) // 2, w, h)
+             for w, h, _ in b_roll]
+
+    background = []
+    t = 0.0
+    while t < duration:
+        for i, (w, h, d) in enumerate(b_roll):
+            if t >= duration or d <= 0:
+                continue
+            end = min(t + d, duration)
+            background.append(Cut(t, end, i, 0.0, boxes[i], None))
+            t = end
+        if not any(d > 0 for _, _, d in b_roll):
+            break
+
+    spans = [s for s in schedule_spans(schedule, duration) if s["position"] not in HIDDEN_POSITIONS]
+    avatar = []
+    for i, seg in enumerate(avatars):
+        seg_start = float(seg["start"])
+        seg_end = min(seg_start + float(seg["duration"]), duration)
+        for span in spans:
+            start, end = max(seg_start, span["start"]), min(seg_end, span["end"])
+            if end <= start:
+                continue
+            box = layout_box(span["position"], width, height, seg["width"], seg["height"])
+            avatar.append(Cut(start, end, i, start - seg_start, box, span["position"]))
+    avatar.sort(key=lambda c: c.start)
+
+    return Timeline(width, height, fps, duration, background, avatar, boxes)
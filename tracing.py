@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Run the current thread is working for; set by Tracer.run and carried into
+# helper threads by propagate()
+_current_run = contextvars.ContextVar("trace_run", default=None)
+
+class Span(dict):
+    """Attributes of one traced call (bytes, retries, ...). Set keys while the span is open."""
+
+    def __init__(self, name, **attrs):
+        super().__init__(attrs)
+        self.name = name
+        self.start = None
+        self.end = None
+        self.thread = threading.get_ident()
+        self.run = _current_run.get()
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+class Tracer:
+    """Collects spans from every thread and exports them as a Chrome trace or a summary table."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        s = Span(name, **attrs)
+        s.start = time.perf_counter()
+        try:
+            yield s
+        except BaseException as e:
+            s["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            s.end = time.perf_counter()
+            with self._lock:
+                self.spans.append(s)
+
+    @contextmanager
+    def run(self, run_id):
+        """Tags spans recorded in this context (and threads started via propagate) with `run_id`."""
+        token = _current_run.set(run_id)
+        try:
+            yield
+        finally:
+            _current_run.reset(token)
+
+    def mark(self):
+        """Position to pass to export/summary to only cover spans recorded from now on."""
+        with self._lock:
+            return len(self.spans)
+
+    def _since(self, since, run=None):
+        with self._lock:
+            spans = list(self.spans[since:])
+        return spans if run is None else [s for s in spans if s.run == run]
+
+    def to_chrome(self, since=0, run=None):
+        """Chrome trace-event JSON (load in chrome://tracing or Perfetto)."""
+        pid = os.getpid()
+        events = []
+        for s in self._since(since, run):
+            events.append({
+                "name": s.name,
+                "cat": s.name.split(".")[0],
+                "ph": "X",
+                "ts": (s.start - self._origin) * 1e6,
+                "dur": (s.end - s.start) * 1e6,
+                "pid": pid,
+                "tid": s.thread,
+                "args": dict(s),
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path, since=0, run=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_chrome(since, run), f, default=str)
+        return path
+
+    def summary(self, since=0, run=None):
+        """Aggregates spans by name: count, total/max seconds, bytes, retries and errors."""
+        rows = {}
+        for s in self._since(since, run):
+            row = rows.setdefault(s.name, {"count": 0, "total_s": 0.0, "max_s": 0.0, "bytes": 0, "retries": 0, "errors": 0})
+            row["count"] += 1
+            row["total_s"] += s.duration
+            row["max_s"] = max(row["max_s"], s.duration)
+            row["bytes"] += s.get("bytes") or 0
+            row["retries"] += s.get("retries") or 0
+            row["errors"] += 1 if "error" in s else 0
+        return rows
+
+    def print_summary(self, since=0, run=None):
+        rows = self.summary(since, run)
+        print("📊 Trace summary:")
+        print(f"   {'span':<24} {'count':>5} {'total':>9} {'max':>9} {'MB':>8} {'retries':>7} {'errors':>6}")
+        for name, r in sorted(rows.items(), key=lambda kv: -kv[1]["total_s"]):
+            print(f"   {name:<24} {r['count']:>5} {r['total_s']:>8.1f}s {r['max_s']:>8.1f}s "
+                  f"{r['bytes'] / 1e6:>8.2f} {r['retries']:>7} {r['errors']:>6}")
+
+def propagate(fn):
+    """Wraps `fn` to run in a copy of the caller's context, so spans from pool threads keep its run tag."""
+    context = contextvars.copy_context()
+    def call(*args, **kwargs):
+        # A Context can't be entered by two threads at once; each call gets its own copy
+        return context.copy().run(fn, *args, **kwargs)
+    return call
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+# Process-wide tracer shared by the engines, assembler and orchestrator
+tracer = Tracer()
+span = tracer.span
@@ -0,0 +1,117 @@
+import os
+import time
+import queue
+import itertools
+import threading
+
+from tracing import span
+
+class GenerationJob:
+    """One queued text-to-video request. Progress arrives as events on `events`."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, params):
+        self.id = next(self._ids)
+        self.params = params
+        self.events = queue.Queue()
+        self.submitted = time.monotonic()
+
+    def emit(self, kind, **data):
+        self.events.put({"type": kind, "job": self.id, **data})
+
+    def stream(self, heartbeat=1.0, ahead=None):
+        """Yields events until the job finishes or fails.
+
+        While waiting in the queue a "queued" event with the current position
+        (from `ahead()`) is repeated every `heartbeat` seconds.
+        """
+        while True:
+            try:
+                event = self.events.get(timeout=heartbeat)
+            except queue.Empty:
+                if ahead:
+                    position = ahead(self)
+                    if position is not None:
+                        yield {"type": "queued", "job": self.id, "ahead": position}
+                continue
+            yield event
+            if event["type"] in ("done", "error"):
+                return
+
+class GenerationWorker:
+    """Runs every local generation on one dedicated thread, first come first served.
+
+    The engine (and the GPU it owns) is touched only from this thread, so
+    concurrent users queue instead of contending for VRAM, and loaded
+    pipelines persist across requests in the engine's ModelCache.
+    """
+
+    def __init__(self, engine, output_dir="generated_videos", max_queue=0):
+        self.engine = engine
+        self.output_dir = output_dir
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._thread = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="videogen-worker", daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, **params):
+        """Queues a generation and returns its GenerationJob. Raises queue.Full when saturated."""
+        self.start()
+        job = GenerationJob(params)
+        with self._lock:
+            self._queue.put_nowait(job)
+            job.emit("queued", ahead=len(self._pending))
+            self._pending.append(job)
+        return job
+
+    def ahead(self, job):
+        """Jobs in front of `job`, or None once it has started."""
+        with self._lock:
+            try:
+                return self._pending.index(job)
+            except ValueError:
+                return None
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._pending.remove(job)
+            try:
+                self._run(job)
+            except Exception as e:
+                job.emit("error", error=str(e))
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        p = dict(job.params)
+        engine = self.engine
+        with span("app.job", model=p.get("model"), waited=time.monotonic() - job.submitted):
+            job.emit("loading", model=p.get("model"))
+            engine.load_model(p.pop("model", None))
+
+            add_audio = p.pop("add_audio", False)
+            steps = int(p.get("steps", 50))
+            job.emit("progress", step=0, total=steps)
+            frames, seed, latency = engine.generate(
+                progress=lambda step, total: job.emit("progress", step=step, total=total), **p)
+
+            audio_path = None
+            if add_audio:
+                job.emit("music")
+                audio_path = engine.generate_audio_bg(p["prompt"])
+
+            job.emit("saving")
+            output_path = os.path.join(self.output_dir, f"vid_{int(time.time())}_{job.id}.mp4")
+            path = engine.save_result(frames, output_path, audio_path=audio_path)
+        job.emit("done", path=path, seed=seed, latency=latency)